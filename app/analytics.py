@@ -0,0 +1,326 @@
+import json
+import struct
+import zlib
+from array import array
+from bisect import bisect_right
+from collections.abc import Iterable
+from dataclasses import dataclass, field, fields
+from threading import Lock
+from time import time
+from typing import BinaryIO
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+RESULTS_MAGIC = b"FPQR"
+RESULTS_VERSION = 1
+RESULTS_HEADER = struct.Struct("<4sIQQ")
+LATENCY_BINS_MS = (250, 500, 1000, 2000, 5000, 10_000, 20_000, 30_000)
+NO_OPTION = 255
+
+
+@dataclass
+class AnswerColumns:
+    question: array = field(default_factory=lambda: array("I"))
+    player: array = field(default_factory=lambda: array("I"))
+    option: array = field(default_factory=lambda: array("B"))
+    correct: array = field(default_factory=lambda: array("B"))
+    latency_ns: array = field(default_factory=lambda: array("q"))
+    points: array = field(default_factory=lambda: array("i"))
+
+    def append(
+        self,
+        question: int,
+        player: int,
+        option: int,
+        correct: bool,
+        latency_ns: int,
+        points: int,
+    ) -> None:
+        self.question.append(question)
+        self.player.append(player)
+        self.option.append(option)
+        self.correct.append(correct)
+        self.latency_ns.append(latency_ns)
+        self.points.append(points)
+
+    def extend(self, other: "AnswerColumns") -> None:
+        for column in self.columns():
+            getattr(self, column).extend(getattr(other, column))
+
+    def clear(self) -> None:
+        for column in self.columns():
+            del getattr(self, column)[:]
+
+    @classmethod
+    def columns(cls) -> tuple[str, ...]:
+        return tuple(f.name for f in fields(cls))
+
+    def __len__(self) -> int:
+        return len(self.question)
+
+
+@dataclass
+class ResultStore:
+    games: list[dict] = field(default_factory=list)
+    questions: list[dict] = field(default_factory=list)
+    players: list[str] = field(default_factory=list)
+    game: array = field(default_factory=lambda: array("I"))
+    answers: AnswerColumns = field(default_factory=AnswerColumns)
+
+    _question_ids: dict[str, int] = field(default_factory=dict, init=False)
+    _player_ids: dict[int, int] = field(default_factory=dict, init=False)
+    _summary: tuple[tuple[int, int], dict] | None = field(default=None, init=False)
+    _lock: Lock = field(default_factory=Lock, init=False)
+
+    def add_game(
+        self,
+        room: str,
+        questions: Iterable[dict],
+        roster: Iterable[tuple[int, str]],
+        question_ids: list[str],
+        columns: AnswerColumns,
+    ) -> None:
+        with self._lock:
+            for question in questions:
+                if question["id"] not in self._question_ids:
+                    self._question_ids[question["id"]] = len(self.questions)
+                    self.questions.append(question)
+            players = array("I")
+            for key, nickname in roster:
+                if key not in self._player_ids:
+                    self._player_ids[key] = len(self.players)
+                    self.players.append(nickname)
+                players.append(self._player_ids[key])
+            question_map = array("I", map(self._question_ids.get, question_ids))
+
+            game = len(self.games)
+            self.games.append(
+                {
+                    "room": room,
+                    "ended_at": time(),
+                    "players": len(players),
+                    "answers": len(columns),
+                }
+            )
+            self.game.extend(array("I", [game]) * len(columns))
+            self.answers.question.extend(remap(question_map, columns.question))
+            self.answers.player.extend(remap(players, columns.player))
+            for column in ("option", "correct", "latency_ns", "points"):
+                getattr(self.answers, column).extend(getattr(columns, column))
+
+    def summary(self, top: int = 20) -> dict:
+        with self._lock:
+            key = (len(self.answers), top)
+            if self._summary is None or self._summary[0] != key:
+                self._summary = (key, summarize(self, top))
+            return self._summary[1]
+
+    def export(self, f: BinaryIO) -> None:
+        with self._lock:
+            columns = {"game": self.game} | {
+                column: getattr(self.answers, column)
+                for column in AnswerColumns.columns()
+            }
+            directory = {
+                "rows": len(self.answers),
+                "games": self.games,
+                "questions": self.questions,
+                "players": self.players,
+                "columns": {},
+            }
+            f.write(RESULTS_HEADER.pack(RESULTS_MAGIC, RESULTS_VERSION, 0, 0))
+            offset = RESULTS_HEADER.size
+            for name, values in columns.items():
+                data = zlib.compress(values.tobytes(), 1)
+                directory["columns"][name] = [values.typecode, offset, len(data)]
+                f.write(data)
+                offset += len(data)
+
+            meta = json.dumps(directory, separators=(",", ":")).encode()
+            f.write(meta)
+            f.seek(0)
+            f.write(
+                RESULTS_HEADER.pack(RESULTS_MAGIC, RESULTS_VERSION, offset, len(meta))
+            )
+            f.seek(0, 2)
+
+    @classmethod
+    def load(cls, f: BinaryIO) -> "ResultStore":
+        data = f.read()
+        magic, version, offset, size = RESULTS_HEADER.unpack_from(data)
+        if magic != RESULTS_MAGIC or version != RESULTS_VERSION:
+            raise ValueError("Not a results file")
+
+        directory = json.loads(data[offset : offset + size])
+        columns = {}
+        for name, (typecode, start, length) in directory["columns"].items():
+            columns[name] = array(
+                typecode, zlib.decompress(data[start : start + length])
+            )
+
+        store = cls(
+            games=directory["games"],
+            questions=directory["questions"],
+            players=directory["players"],
+            game=columns.pop("game"),
+            answers=AnswerColumns(**columns),
+        )
+        store._question_ids = {q["id"]: i for i, q in enumerate(store.questions)}
+        return store
+
+
+def remap(mapping: array, values: array) -> array:
+    if np is None:
+        return array(values.typecode, map(mapping.__getitem__, values))
+    mapped = np.frombuffer(mapping, dtype=mapping.typecode)[
+        np.frombuffer(values, dtype=values.typecode)
+    ]
+    return array(values.typecode, mapped.astype(values.typecode).tobytes())
+
+
+def summarize(store: ResultStore, top: int) -> dict:
+    answers = store.answers
+    rows = len(answers)
+    questions, players = len(store.questions), len(store.players)
+    if rows == 0:
+        return {"rows": 0, "games": len(store.games), "questions": [], "players": []}
+
+    stride = max(max(len(q["options"]) for q in store.questions), 1)
+    bins = len(LATENCY_BINS_MS) + 1
+    if np is None:
+        totals = python_totals(answers, questions, players, stride)
+    else:
+        totals = numpy_totals(answers, questions, players, stride)
+    asked, right, latency, distribution, histogram, *per_player = totals
+    answered, correct, points, streaks = per_player
+
+    overall = [0] * bins
+    for index in range(questions):
+        for bin, count in enumerate(histogram[index * bins : (index + 1) * bins]):
+            overall[bin] += count
+
+    return {
+        "rows": rows,
+        "games": len(store.games),
+        "latency_bins_ms": [*LATENCY_BINS_MS, None],
+        "latency_histogram": overall,
+        "questions": [
+            {
+                "statement": question["statement"],
+                "answered": asked[index],
+                "accuracy": right[index] / asked[index] if asked[index] else None,
+                "mean_latency_ms": latency[index] / asked[index] / 1e6
+                if asked[index]
+                else None,
+                "distribution": dict(
+                    zip(
+                        question["options"],
+                        distribution[index * stride : index * stride + stride],
+                    )
+                ),
+                "latency_histogram": histogram[index * bins : (index + 1) * bins],
+            }
+            for index, question in enumerate(store.questions)
+        ],
+        "players": [
+            {
+                "nickname": store.players[index],
+                "points": points[index],
+                "answered": answered[index],
+                "correct": correct[index],
+                "best_streak": streaks[index],
+            }
+            for index in sorted(range(players), key=lambda i: -points[i])[:top]
+        ],
+    }
+
+
+def numpy_totals(
+    answers: AnswerColumns, questions: int, players: int, stride: int
+) -> tuple[list, ...]:
+    question = np.frombuffer(answers.question, dtype=np.uint32).astype(np.int64)
+    player = np.frombuffer(answers.player, dtype=np.uint32).astype(np.int64)
+    option = np.frombuffer(answers.option, dtype=np.uint8).astype(np.int64)
+    correct = np.frombuffer(answers.correct, dtype=np.uint8).astype(np.int64)
+    latency = np.frombuffer(answers.latency_ns, dtype=np.int64)
+    points = np.frombuffer(answers.points, dtype=np.int32).astype(np.int64)
+
+    bins = len(LATENCY_BINS_MS) + 1
+    binned = np.searchsorted(
+        np.array(LATENCY_BINS_MS) * 1_000_000, latency, side="right"
+    )
+    valid = option < stride
+
+    order = np.argsort(player, kind="stable")
+    ordered, hits = player[order], correct[order]
+    index = np.arange(len(order))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = ordered[1:] != ordered[:-1]
+    breaks = np.maximum(np.where(hits == 0, index, -1), np.where(first, index - 1, -1))
+    run = np.where(hits == 1, index - np.maximum.accumulate(breaks), 0)
+    streaks = np.zeros(players, dtype=np.int64)
+    starts = np.flatnonzero(first)
+    streaks[ordered[starts]] = np.maximum.reduceat(run, starts)
+
+    return tuple(
+        column.tolist()
+        for column in (
+            np.bincount(question, minlength=questions),
+            np.bincount(question, weights=correct, minlength=questions).astype(int),
+            np.bincount(question, weights=latency, minlength=questions),
+            np.bincount(
+                question[valid] * stride + option[valid], minlength=questions * stride
+            ),
+            np.bincount(question * bins + binned, minlength=questions * bins),
+            np.bincount(player, minlength=players),
+            np.bincount(player, weights=correct, minlength=players).astype(int),
+            np.bincount(player, weights=points, minlength=players).astype(int),
+            streaks,
+        )
+    )
+
+
+def python_totals(
+    answers: AnswerColumns, questions: int, players: int, stride: int
+) -> tuple[list, ...]:
+    bins = len(LATENCY_BINS_MS) + 1
+    asked, right, latency = [0] * questions, [0] * questions, [0] * questions
+    distribution, histogram = [0] * (questions * stride), [0] * (questions * bins)
+    answered, correct, points = [0] * players, [0] * players, [0] * players
+    streaks, runs = [0] * players, [0] * players
+    limits = [limit * 1_000_000 for limit in LATENCY_BINS_MS]
+
+    for q, p, o, c, ns, pts in zip(
+        answers.question,
+        answers.player,
+        answers.option,
+        answers.correct,
+        answers.latency_ns,
+        answers.points,
+    ):
+        asked[q] += 1
+        right[q] += c
+        latency[q] += ns
+        if o < stride:
+            distribution[q * stride + o] += 1
+        histogram[q * bins + bisect_right(limits, ns)] += 1
+        answered[p] += 1
+        correct[p] += c
+        points[p] += pts
+        runs[p] = runs[p] + 1 if c else 0
+        streaks[p] = max(streaks[p], runs[p])
+
+    return (
+        asked,
+        right,
+        latency,
+        distribution,
+        histogram,
+        answered,
+        correct,
+        points,
+        streaks,
+    )
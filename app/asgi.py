@@ -0,0 +1,79 @@
+import asyncio
+import os
+from time import monotonic_ns
+
+from a2wsgi import WSGIMiddleware
+from config.app import create_app
+from tools.ingress import RECEIVED_AT
+from views.game import event_subscription
+
+app = create_app()
+wsgi = WSGIMiddleware(app, workers=int(os.environ.get("FAST_PUNCH_THREADS", "32")))
+
+EVENTS_PATH = "/events"
+
+
+async def events(scope, receive, send) -> None:
+    headers = [(k.decode("latin-1"), v.decode("latin-1")) for k, v in scope["headers"]]
+    with app.test_request_context(EVENTS_PATH, headers=headers) as ctx:
+        hub, channels, key, player, last_event_id = event_subscription()
+        response = app.response_class(mimetype="text/event-stream")
+        response.headers["Cache-Control"] = "no-cache"
+        app.session_interface.save_session(app, ctx.session, response)
+
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (k.lower().encode("latin-1"), v.encode("latin-1"))
+                for k, v in response.headers.items()
+            ],
+        }
+    )
+
+    stream = hub.alisten(*channels, key=key, player=player, last_event_id=last_event_id)
+
+    async def forward() -> None:
+        async for message in stream:
+            await send(
+                {"type": "http.response.body", "body": message, "more_body": True}
+            )
+
+    async def disconnect() -> None:
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    tasks = [asyncio.create_task(forward()), asyncio.create_task(disconnect())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await stream.aclose()
+
+    try:
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+    except OSError:
+        pass
+
+
+async def lifespan(scope, receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send) -> None:
+    scope[RECEIVED_AT] = monotonic_ns()
+    if scope["type"] == "lifespan":
+        await lifespan(scope, receive, send)
+    elif scope["type"] == "http" and scope["path"] == EVENTS_PATH:
+        await events(scope, receive, send)
+    else:
+        await wsgi(scope, receive, send)
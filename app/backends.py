@@ -0,0 +1,344 @@
+import json
+import sqlite3
+from abc import ABC, abstractmethod
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from threading import local
+from time import time
+from uuid import uuid4
+
+from journal import RESET
+
+SEPARATOR = b"\x00"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rooms (
+    code TEXT PRIMARY KEY,
+    owner TEXT,
+    lease REAL NOT NULL DEFAULT 0,
+    state TEXT
+);
+CREATE TABLE IF NOT EXISTS players (
+    room TEXT NOT NULL,
+    key INTEGER NOT NULL,
+    nickname TEXT NOT NULL,
+    avatar TEXT,
+    points INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (room, key)
+);
+CREATE INDEX IF NOT EXISTS players_points ON players (room, points);
+CREATE TABLE IF NOT EXISTS commands (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    room TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS commands_room ON commands (room, id);
+CREATE TABLE IF NOT EXISTS log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    room TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS log_room ON log (room, id);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    room TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    payload BLOB NOT NULL
+);
+"""
+
+
+@dataclass
+class StateBackend(ABC):
+    worker: str = field(default_factory=lambda: uuid4().hex)
+    interval: float = 0.05
+
+    @property
+    @abstractmethod
+    def shared(self) -> bool: ...
+
+    @abstractmethod
+    def create_room(self, code: str) -> bool: ...
+
+    @abstractmethod
+    def has_room(self, code: str) -> bool: ...
+
+    @abstractmethod
+    def acquire(self, code: str) -> bool: ...
+
+    @abstractmethod
+    def register(
+        self, code: str, key: int, nickname: str, avatar: str | None
+    ) -> bool: ...
+
+    @abstractmethod
+    def player(self, code: str, key: int) -> tuple[str, str | None, int] | None: ...
+
+    @abstractmethod
+    def save_scores(self, code: str, scores: Iterable[tuple[int, int]]) -> None: ...
+
+    @abstractmethod
+    def scores(self, code: str) -> list[tuple[int, int]]: ...
+
+    @abstractmethod
+    def append(self, code: str, kind: str, payload: dict) -> None: ...
+
+    @abstractmethod
+    def commands(self, code: str, after: int) -> list[tuple[int, str, dict]]: ...
+
+    @abstractmethod
+    def record(self, code: str, records: list[tuple[str, dict]]) -> None: ...
+
+    @abstractmethod
+    def history(self, code: str) -> list[tuple[str, dict]]: ...
+
+    @abstractmethod
+    def broadcast(
+        self, code: str, channel: str, messages: tuple[bytes, ...]
+    ) -> None: ...
+
+    @abstractmethod
+    def events(self, after: int) -> list[tuple[int, str, str, tuple[bytes, ...]]]: ...
+
+    @abstractmethod
+    def last_event(self) -> int: ...
+
+    @abstractmethod
+    def save_state(self, code: str, state: dict) -> None: ...
+
+    @abstractmethod
+    def load_state(self, code: str) -> dict | None: ...
+
+    @abstractmethod
+    def reset_room(self, code: str) -> None: ...
+
+
+@dataclass
+class MemoryBackend(StateBackend):
+    @property
+    def shared(self) -> bool:
+        return False
+
+    def create_room(self, code: str) -> bool:
+        return True
+
+    def has_room(self, code: str) -> bool:
+        return False
+
+    def acquire(self, code: str) -> bool:
+        return True
+
+    def register(self, code: str, key: int, nickname: str, avatar: str | None) -> bool:
+        return True
+
+    def player(self, code: str, key: int) -> tuple[str, str | None, int] | None:
+        return None
+
+    def save_scores(self, code: str, scores: Iterable[tuple[int, int]]) -> None:
+        pass
+
+    def scores(self, code: str) -> list[tuple[int, int]]:
+        return []
+
+    def append(self, code: str, kind: str, payload: dict) -> None:
+        pass
+
+    def commands(self, code: str, after: int) -> list[tuple[int, str, dict]]:
+        return []
+
+    def record(self, code: str, records: list[tuple[str, dict]]) -> None:
+        pass
+
+    def history(self, code: str) -> list[tuple[str, dict]]:
+        return []
+
+    def broadcast(self, code: str, channel: str, messages: tuple[bytes, ...]) -> None:
+        pass
+
+    def events(self, after: int) -> list[tuple[int, str, str, tuple[bytes, ...]]]:
+        return []
+
+    def last_event(self) -> int:
+        return 0
+
+    def save_state(self, code: str, state: dict) -> None:
+        pass
+
+    def load_state(self, code: str) -> dict | None:
+        return None
+
+    def reset_room(self, code: str) -> None:
+        pass
+
+
+@dataclass
+class SQLiteBackend(StateBackend):
+    path: str = "fast-punch.db"
+    lease: float = 10.0
+    keep_events: int = 1000
+
+    _local: local = field(default_factory=local, init=False)
+
+    def __post_init__(self):
+        self.__db().executescript(SCHEMA)
+
+    @property
+    def shared(self) -> bool:
+        return True
+
+    def __db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def __transaction(self) -> Iterator[sqlite3.Connection]:
+        db = self.__db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def create_room(self, code: str) -> bool:
+        cursor = self.__db().execute(
+            "INSERT OR IGNORE INTO rooms (code) VALUES (?)", (code,)
+        )
+        return cursor.rowcount == 1
+
+    def has_room(self, code: str) -> bool:
+        row = self.__db().execute("SELECT 1 FROM rooms WHERE code = ?", (code,))
+        return row.fetchone() is not None
+
+    def acquire(self, code: str) -> bool:
+        now = time()
+        with self.__transaction() as db:
+            db.execute("INSERT OR IGNORE INTO rooms (code) VALUES (?)", (code,))
+            db.execute(
+                "UPDATE rooms SET owner = ?, lease = ? "
+                "WHERE code = ? AND (owner IS NULL OR owner = ? OR lease < ?)",
+                (self.worker, now + self.lease, code, self.worker, now),
+            )
+            row = db.execute("SELECT owner FROM rooms WHERE code = ?", (code,))
+            return row.fetchone()[0] == self.worker
+
+    def register(self, code: str, key: int, nickname: str, avatar: str | None) -> bool:
+        cursor = self.__db().execute(
+            "INSERT OR IGNORE INTO players (room, key, nickname, avatar) "
+            "VALUES (?, ?, ?, ?)",
+            (code, key, nickname, avatar),
+        )
+        return cursor.rowcount == 1
+
+    def player(self, code: str, key: int) -> tuple[str, str | None, int] | None:
+        row = self.__db().execute(
+            "SELECT nickname, avatar, points FROM players WHERE room = ? AND key = ?",
+            (code, key),
+        )
+        return row.fetchone()
+
+    def save_scores(self, code: str, scores: Iterable[tuple[int, int]]) -> None:
+        with self.__transaction() as db:
+            db.executemany(
+                "UPDATE players SET points = ? WHERE room = ? AND key = ?",
+                ((points, code, key) for key, points in scores),
+            )
+
+    def scores(self, code: str) -> list[tuple[int, int]]:
+        rows = self.__db().execute(
+            "SELECT key, points FROM players WHERE room = ? ORDER BY points", (code,)
+        )
+        return rows.fetchall()
+
+    def append(self, code: str, kind: str, payload: dict) -> None:
+        self.__db().execute(
+            "INSERT INTO commands (room, kind, payload) VALUES (?, ?, ?)",
+            (code, kind, json.dumps(payload)),
+        )
+
+    def commands(self, code: str, after: int) -> list[tuple[int, str, dict]]:
+        rows = self.__db().execute(
+            "SELECT id, kind, payload FROM commands WHERE room = ? AND id > ? "
+            "ORDER BY id",
+            (code, after),
+        )
+        return [(id, kind, json.loads(payload)) for id, kind, payload in rows]
+
+    def record(self, code: str, records: list[tuple[str, dict]]) -> None:
+        resets = [index for index, (kind, _) in enumerate(records) if kind == RESET]
+        with self.__transaction() as db:
+            if resets:
+                db.execute("DELETE FROM log WHERE room = ?", (code,))
+                records = records[resets[-1] :]
+            db.executemany(
+                "INSERT INTO log (room, kind, payload) VALUES (?, ?, ?)",
+                (
+                    (code, kind, json.dumps(payload, separators=(",", ":")))
+                    for kind, payload in records
+                ),
+            )
+
+    def history(self, code: str) -> list[tuple[str, dict]]:
+        rows = self.__db().execute(
+            "SELECT kind, payload FROM log WHERE room = ? ORDER BY id", (code,)
+        )
+        return [(kind, json.loads(payload)) for kind, payload in rows]
+
+    def broadcast(self, code: str, channel: str, messages: tuple[bytes, ...]) -> None:
+        with self.__transaction() as db:
+            cursor = db.execute(
+                "INSERT INTO events (room, channel, payload) VALUES (?, ?, ?)",
+                (code, channel, SEPARATOR.join(messages)),
+            )
+            db.execute(
+                "DELETE FROM events WHERE id <= ?",
+                (cursor.lastrowid - self.keep_events,),
+            )
+
+    def events(self, after: int) -> list[tuple[int, str, str, tuple[bytes, ...]]]:
+        rows = self.__db().execute(
+            "SELECT id, room, channel, payload FROM events WHERE id > ? ORDER BY id",
+            (after,),
+        )
+        return [
+            (id, room, channel, tuple(payload.split(SEPARATOR)))
+            for id, room, channel, payload in rows
+        ]
+
+    def last_event(self) -> int:
+        row = self.__db().execute("SELECT COALESCE(MAX(id), 0) FROM events")
+        return row.fetchone()[0]
+
+    def save_state(self, code: str, state: dict) -> None:
+        self.__db().execute(
+            "UPDATE rooms SET state = ? WHERE code = ?", (json.dumps(state), code)
+        )
+
+    def load_state(self, code: str) -> dict | None:
+        row = self.__db().execute("SELECT state FROM rooms WHERE code = ?", (code,))
+        row = row.fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def reset_room(self, code: str) -> None:
+        with self.__transaction() as db:
+            db.execute("DELETE FROM players WHERE room = ?", (code,))
+            db.execute("DELETE FROM commands WHERE room = ?", (code,))
+
+
+def backend_from_url(url: str | None) -> StateBackend:
+    if not url or url == "memory":
+        return MemoryBackend()
+
+    scheme, _, path = url.partition(":")
+    if scheme == "sqlite" and path:
+        return SQLiteBackend(path=path.removeprefix("//"))
+    raise ValueError(f"Unknown state backend: {url}")
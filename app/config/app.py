@@ -1,10 +1,15 @@
 import os
 from uuid import uuid4
 
+from backends import backend_from_url
 from flask import Flask
-from repository import PlayerRepository, QuizzRepository
-from services import QuestionService
-from tools.load_default import load_files
+from journal import Journal
+from rooms import RoomRegistry
+from tools.admission import AdmissionGate
+from tools.bank_watcher import BankWatcher
+from tools.ingress import IngressStamp
+from tools.metrics import REGISTRY
+from tools.static_assets import StaticAssets
 from views.configure import router_configure
 from views.game import router
 
@@ -15,18 +20,34 @@ STATIC_DIR = os.path.join(APP_DIR, "static")
 
 def create_app() -> Flask:
     app = Flask("quizz", template_folder=TEMPL_DIR, static_folder=STATIC_DIR)
-    app.secret_key = uuid4().hex
-
-    quizz_repository = QuizzRepository()
-    load_files(quizz_repository, os.path.join(APP_DIR, "data"))
-
-    repo = PlayerRepository()
-    app.extensions["repo"] = repo
-
-    serv = QuestionService(players=repo, quizz=quizz_repository)
-    serv.init_app(app)
+    app.secret_key = os.environ.get("FAST_PUNCH_SECRET") or uuid4().hex
+    app.wsgi_app = IngressStamp(app.wsgi_app)
+    REGISTRY.init_app(app)
+    StaticAssets(STATIC_DIR).init_app(app)
+    AdmissionGate(
+        limit=int(os.environ.get("FAST_PUNCH_JOIN_LIMIT", "4")),
+        queue=int(os.environ.get("FAST_PUNCH_JOIN_QUEUE", "16")),
+    ).init_app(app)
+
+    watcher = BankWatcher(
+        os.path.join(APP_DIR, "data"),
+        interval=float(os.environ.get("FAST_PUNCH_RELOAD", "2.0")),
+    )
+    backend = backend_from_url(os.environ.get("FAST_PUNCH_STATE"))
+    journal = os.environ.get("FAST_PUNCH_JOURNAL")
+    if journal and backend.shared:
+        raise ValueError("FAST_PUNCH_JOURNAL needs the in-memory state backend")
+    rooms = RoomRegistry(
+        bank=watcher.bank,
+        backend=backend,
+        journal=Journal(journal) if journal else None,
+    )
+    watcher.on_reload(rooms.use_bank)
+    rooms.init_app(app)
+    watcher.init_app(app)
 
     app.register_blueprint(router)
     app.register_blueprint(router_configure)
+    rooms.resume()
 
     return app
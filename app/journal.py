@@ -0,0 +1,170 @@
+import json
+import logging
+import os
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from threading import Condition, Thread
+from time import perf_counter
+from typing import BinaryIO
+
+from tools.metrics import REGISTRY, SIZE_BUCKETS
+
+logger = logging.getLogger("quizz.journal")
+
+CLOSE = "close"
+RESET = "reset"
+
+BATCH_RECORDS = REGISTRY.histogram(
+    "quizz_journal_batch_records", "Records written per group commit", (), SIZE_BUCKETS
+).labels()
+FSYNC_SECONDS = REGISTRY.histogram(
+    "quizz_journal_fsync_seconds", "Time spent in fsync per group commit"
+).labels()
+
+
+@dataclass
+class Journal:
+    path: str
+    compact_bytes: int = 16 << 20
+
+    _pending: list[bytes] = field(default_factory=list, init=False)
+    _appended: int = field(default=0, init=False)
+    _synced: int = field(default=0, init=False)
+    _size: int = field(default=0, init=False)
+    _base: int = field(default=0, init=False)
+    _closed: bool = field(default=False, init=False)
+    _file: BinaryIO | None = field(default=None, init=False)
+    _thread: Thread | None = field(default=None, init=False)
+    _condition: Condition = field(default_factory=Condition, init=False)
+
+    def append(self, room: str, kind: str, payload: dict) -> None:
+        line = json.dumps([room, kind, payload], separators=(",", ":")).encode()
+        with self._condition:
+            if self._thread is None:
+                self.__start()
+            self._pending.append(line + b"\n")
+            self._appended += 1
+            if len(self._pending) == 1:
+                self._condition.notify_all()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        with self._condition:
+            target = self._appended
+            return self._condition.wait_for(lambda: self._synced >= target, timeout)
+
+    def close(self) -> None:
+        self.flush()
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def replay(self) -> Iterator[tuple[str, str, dict]]:
+        if not os.path.exists(self.path):
+            return
+
+        start, records, offset = perf_counter(), 0, 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    room, kind, payload = json.loads(line)
+                except ValueError:
+                    break
+                offset += len(line)
+                records += 1
+                yield room, kind, payload
+
+        if offset < os.path.getsize(self.path):
+            logger.warning("journal %s: dropping a torn tail at %d", self.path, offset)
+            os.truncate(self.path, offset)
+        logger.info(
+            "journal %s: replayed %d records in %.3fs",
+            self.path,
+            records,
+            perf_counter() - start,
+        )
+
+    def __start(self) -> None:
+        # Owned by the writer thread, which closes it when the journal closes.
+        self._file = open(self.path, "ab")  # noqa: SIM115
+        self._size = self._base = self._file.tell()
+        self._thread = Thread(target=self.__run, name="journal", daemon=True)
+        self._thread.start()
+
+    def __run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    self._file.close()
+                    return
+                batch, self._pending = self._pending, []
+                appended = self._appended
+
+            data = b"".join(batch)
+            self._file.write(data)
+            self._file.flush()
+            start = perf_counter()
+            os.fsync(self._file.fileno())
+            FSYNC_SECONDS.observe(perf_counter() - start)
+            BATCH_RECORDS.observe(len(batch))
+            self._size += len(data)
+
+            with self._condition:
+                self._synced = appended
+                self._condition.notify_all()
+
+            if self._size > max(self.compact_bytes, 2 * self._base):
+                try:
+                    self.__compact()
+                except OSError:
+                    logger.exception("journal %s: compaction failed", self.path)
+
+    def __compact(self) -> None:
+        start = perf_counter()
+        starts: dict[str, int] = {}
+        offset = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                room, kind = head(line)
+                if kind == RESET:
+                    starts[room] = offset
+                elif kind == CLOSE:
+                    starts[room] = self._size
+                offset += len(line)
+
+            f.seek(0)
+            partial = f"{self.path}.compact"
+            with open(partial, "wb") as compacted:
+                offset = 0
+                for line in f:
+                    if offset >= starts.get(head(line)[0], 0):
+                        compacted.write(line)
+                    offset += len(line)
+                compacted.flush()
+                os.fsync(compacted.fileno())
+
+        os.replace(partial, self.path)
+        self._file.close()
+        self._file = open(self.path, "ab")  # noqa: SIM115
+        self._size = self._base = self._file.tell()
+        directory = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+        logger.info(
+            "journal %s: compacted %d to %d bytes in %.3fs",
+            self.path,
+            offset,
+            self._size,
+            perf_counter() - start,
+        )
+
+
+def head(line: bytes) -> tuple[str, str]:
+    _, room, _, kind, _ = line.split(b'"', 4)
+    return room.decode(), kind.decode()
@@ -1,9 +1,11 @@
 from dataclasses import dataclass, field
+from hashlib import blake2b
+from math import factorial
 from random import shuffle
 from uuid import uuid4
 
 
-@dataclass
+@dataclass(slots=True)
 class Player:
     nickname: str
     avatar: str | None = field(default=None)
@@ -11,7 +13,8 @@ class Player:
     _point: int = 0
 
     def __hash__(self):
-        return hash(self.nickname)
+        digest = blake2b(self.nickname.encode(), digest_size=8).digest()
+        return int.from_bytes(digest) >> 1
 
     def add_point(self, point: int):
         self._point += point
@@ -27,7 +30,11 @@ class Question:
     answer: str
     options: list[str]
     id: str = field(default_factory=lambda: uuid4().hex)
-    __answers: dict[str, int] = field(init=False, default_factory=dict)
+    categories: list[str] = field(default_factory=list)
+    difficulty: int | None = None
+    language: str | None = None
+    __answers: dict[int, dict[str, int]] = field(init=False, default_factory=dict)
+    __permutations: list[list[str]] = field(init=False, default_factory=list)
 
     def __post_init__(self):
         self.reset_answers()
@@ -36,9 +43,14 @@ class Question:
     def check_answer(self, answer: str) -> bool:
         return answer == self.answer
 
-    def add_answer(self, option: str):
-        if option in self.__answers:
-            self.__answers[option] += 1
+    def add_answer(self, option: str, stripe: int = 0):
+        if option not in self.options:
+            return
+
+        tally = self.__answers.get(stripe)
+        if tally is None:
+            tally = self.__answers.setdefault(stripe, dict.fromkeys(self.options, 0))
+        tally[option] += 1
 
     @property
     def random_option(self) -> str:
@@ -46,12 +58,29 @@ class Question:
         shuffle(list_copy)
         return list_copy
 
+    def permutations(self, total: int) -> list[list[str]]:
+        total = min(total, factorial(len(self.options)))
+        seen = {tuple(p) for p in self.__permutations}
+        for _ in range(total * 8):
+            if len(self.__permutations) >= total:
+                break
+            option = tuple(self.random_option)
+            if option not in seen:
+                seen.add(option)
+                self.__permutations.append(list(option))
+
+        return self.__permutations[:total]
+
     @property
     def answers(self) -> dict[str, int]:
-        return self.__answers
+        totals = dict.fromkeys(self.options, 0)
+        for tally in tuple(self.__answers.values()):
+            for option, total in tally.items():
+                totals[option] += total
+        return totals
 
     def reset_answers(self):
-        self.__answers = {option: 0 for option in self.options}
+        self.__answers = {}
 
 
 @dataclass
@@ -1,37 +1,425 @@
-from dataclasses import dataclass, field
-from random import shuffle
+import json
+import mmap
+import re
+import struct
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass, field, replace
+from itertools import accumulate
+from random import randrange, sample, shuffle
+from threading import Lock
 
 from model import Player, Question
 
 
+@dataclass
+class Leaderboard:
+    _buckets: dict[int, dict[int, None]] = field(default_factory=dict)
+    _scores: list[int] = field(default_factory=list)
+    _tree: list[int] = field(default_factory=lambda: [0] * 65)
+    _total: int = 0
+
+    def add(self, id: int, score: int) -> None:
+        self.__insert(id, score)
+
+    def move(self, id: int, old: int, score: int) -> None:
+        self.__delete(id, old)
+        self.__insert(id, score)
+
+    def top(self, total: int) -> list[int]:
+        ids = []
+        for score in reversed(self._scores):
+            for id in self._buckets[score]:
+                if len(ids) >= total:
+                    return ids
+                ids.append(id)
+        return ids
+
+    def rank_of(self, score: int) -> int:
+        return self._total - self.__prefix(score) + 1
+
+    def clear(self) -> None:
+        self._buckets.clear()
+        self._scores.clear()
+        self._tree = [0] * 65
+        self._total = 0
+
+    def __insert(self, id: int, score: int) -> None:
+        self.__reserve(score)
+        bucket = self._buckets.get(score)
+        if bucket is None:
+            bucket = self._buckets[score] = {}
+            insort(self._scores, score)
+        bucket[id] = None
+        self._total += 1
+        self.__update(score, 1)
+
+    def __delete(self, id: int, score: int) -> None:
+        bucket = self._buckets.get(score)
+        if bucket is None or id not in bucket:
+            return
+        del bucket[id]
+        if not bucket:
+            del self._buckets[score]
+            del self._scores[bisect_left(self._scores, score)]
+        self._total -= 1
+        self.__update(score, -1)
+
+    def __update(self, score: int, delta: int) -> None:
+        index = score + 1
+        while index < len(self._tree):
+            self._tree[index] += delta
+            index += index & -index
+
+    def __prefix(self, score: int) -> int:
+        total = 0
+        index = min(score + 1, len(self._tree) - 1)
+        while index > 0:
+            total += self._tree[index]
+            index -= index & -index
+        return total
+
+    def __reserve(self, score: int) -> None:
+        size = len(self._tree) - 1
+        if score < size:
+            return
+
+        while score >= size:
+            size *= 2
+        self._tree = [0] * (size + 1)
+        for bucket_score, bucket in self._buckets.items():
+            self.__update(bucket_score, len(bucket))
+
+
+BANK_MAGIC = b"FPQB"
+BANK_VERSION = 2
+BANK_HEADER = struct.Struct("<4sIQQQQ")
+
+
 @dataclass
 class PlayerRepository:
-    players: dict[str, Player] = field(default_factory=dict)
+    leaderboard: Leaderboard = field(default_factory=Leaderboard)
+    stripes: int = 16
+
+    _ids: dict[int, int] = field(default_factory=dict, init=False)
+    _keys: array = field(default_factory=lambda: array("q"), init=False)
+    _nicknames: list[str] = field(default_factory=list, init=False)
+    _avatars: list[str | None] = field(default_factory=list, init=False)
+    _points: array = field(default_factory=lambda: array("q"), init=False)
+    _lock: Lock = field(default_factory=Lock, init=False)
+    _moves: tuple[list[tuple[int, int, int]], ...] = field(default=(), init=False)
+    _stripes: tuple[Lock, ...] = field(default=(), init=False)
+
+    def __post_init__(self):
+        self._moves = tuple([] for _ in range(self.stripes))
+        self._stripes = tuple(Lock() for _ in range(self.stripes))
 
     def add_player(self, player: Player) -> bool:
-        if self.players.get(player.__hash__()):
-            return False
+        key = player.__hash__()
+        with self._lock:
+            if key in self._ids:
+                return False
 
-        self.players[player.__hash__()] = player
+            id = self._ids[key] = len(self._keys)
+            self._keys.append(key)
+            self._nicknames.append(player.nickname)
+            self._avatars.append(player.avatar)
+            self._points.append(player.total)
+            self.leaderboard.add(id, player.total)
         return True
 
-    def get_player(self, key: int) -> Player:
-        return self.players.get(key)
+    def id_of(self, key: int | None) -> int | None:
+        return self._ids.get(key)
+
+    def get_player(self, key: int | None) -> Player | None:
+        id = self._ids.get(key)
+        return None if id is None else self.__player(id)
+
+    def __player(self, id: int) -> Player:
+        return Player(self._nicknames[id], self._avatars[id], self._points[id])
+
+    def add_point(self, id: int, point: int) -> None:
+        stripe = id % self.stripes
+        with self._stripes[stripe]:
+            old = self._points[id]
+            self._points[id] = old + point
+            self._moves[stripe].append((id, old, old + point))
+
+    def rank_of(self, key: int) -> int | None:
+        id = self._ids.get(key)
+        if id is None:
+            return None
+        with self._lock:
+            self.__settle()
+            return self.leaderboard.rank_of(self._points[id])
+
+    def top(self, total: int) -> list[Player]:
+        with self._lock:
+            self.__settle()
+            return [self.__player(id) for id in self.leaderboard.top(total)]
+
+    def __settle(self) -> None:
+        for lock, moves in zip(self._stripes, self._moves):
+            if not moves:
+                continue
+            with lock:
+                pending = moves.copy()
+                moves.clear()
+            for id, old, score in pending:
+                self.leaderboard.move(id, old, score)
+
+    def roster(self) -> list[tuple[int, str]]:
+        with self._lock:
+            return list(zip(self._keys, self._nicknames))
+
+    def scores(self) -> list[tuple[int, int]]:
+        with self._lock:
+            return list(zip(self._keys, self._points))
+
+    @property
+    def total(self) -> int:
+        return len(self._keys)
 
     def reset(self):
-        self.players.clear()
+        with self._lock:
+            for lock in self._stripes:
+                lock.acquire()
+            try:
+                self._ids.clear()
+                del self._keys[:]
+                self._nicknames.clear()
+                self._avatars.clear()
+                del self._points[:]
+                for moves in self._moves:
+                    moves.clear()
+                self.leaderboard.clear()
+            finally:
+                for lock in self._stripes:
+                    lock.release()
 
     def players_by_points(self) -> list[Player]:
-        return sorted(self.players.values(), key=lambda p: p.total, reverse=True)
+        return self.top(self.total)
+
+
+NO_DIFFICULTY = 255
+NO_LANGUAGE = 0xFFFF
+FILTER_TERM = re.compile(r"(category|difficulty|language)\s*(<=|>=|=|<|>)\s*(.+)")
+QUOTA_TERM = re.compile(r"(.+?)\s*[:=]\s*(\d+)")
+
+
+@dataclass(frozen=True)
+class QuestionQuery:
+    categories: tuple[str, ...] = ()
+    language: str | None = None
+    difficulty: tuple[int, int] | None = None
+    quotas: tuple[tuple[str, int], ...] = ()
+
+    @classmethod
+    def parse(cls, filters: str = "", quotas: str = "") -> "QuestionQuery":
+        categories, language, low, high = [], None, 0, NO_DIFFICULTY - 1
+        ranged = False
+        for term in filter(None, (t.strip() for t in filters.split(","))):
+            match = FILTER_TERM.fullmatch(term)
+            if match is None:
+                raise ValueError(f"Invalid filter: {term}")
+            name, op, value = match.group(1), match.group(2), match.group(3).strip()
+            if name != "difficulty":
+                if op != "=":
+                    raise ValueError(f"Invalid filter: {term}")
+                if name == "category":
+                    categories.append(value)
+                else:
+                    language = value
+                continue
+
+            if not value.isdigit():
+                raise ValueError(f"Invalid filter: {term}")
+            level = int(value)
+            ranged = True
+            if op in ("=", ">="):
+                low = max(low, level)
+            if op in ("=", "<="):
+                high = min(high, level)
+            if op == ">":
+                low = max(low, level + 1)
+            if op == "<":
+                high = min(high, level - 1)
+
+        counts = []
+        for term in filter(None, (t.strip() for t in quotas.split(","))):
+            match = QUOTA_TERM.fullmatch(term)
+            if match is None:
+                raise ValueError(f"Invalid quota: {term}")
+            counts.append((match.group(1), int(match.group(2))))
+
+        return cls(
+            categories=tuple(categories),
+            language=language,
+            difficulty=(low, high) if ranged else None,
+            quotas=tuple(counts),
+        )
+
+    def with_category(self, category: str) -> "QuestionQuery":
+        return replace(self, categories=(*self.categories, category), quotas=())
+
+
+@dataclass
+class QuestionIndex:
+    difficulty: Sequence[int] = field(default_factory=bytearray)
+    language: Sequence[int] = field(default_factory=lambda: array("H"))
+    languages: list[str] = field(default_factory=list)
+    postings: dict[str, Sequence[int]] = field(default_factory=dict)
+
+    def add(
+        self, categories: list[str], difficulty: int | None, language: str | None
+    ) -> None:
+        index = len(self.difficulty)
+        level = NO_DIFFICULTY if difficulty is None else min(difficulty, 254)
+        self.difficulty.append(level)
+        self.language.append(self.__language(language))
+
+        terms = {f"category:{category}" for category in categories}
+        terms.add(f"difficulty:{level}")
+        if language is not None:
+            terms.add(f"language:{language}")
+        for term in terms:
+            self.postings.setdefault(term, array("I")).append(index)
+
+    def prefix(self, total: int) -> "QuestionIndex":
+        postings = {}
+        for term, posting in self.postings.items():
+            posting = posting[: bisect_left(posting, total)]
+            if posting:
+                postings[term] = posting
+        return QuestionIndex(
+            difficulty=self.difficulty[:total],
+            language=self.language[:total],
+            languages=self.languages.copy(),
+            postings=postings,
+        )
+
+    def __language(self, language: str | None) -> int:
+        if language is None:
+            return NO_LANGUAGE
+        if language not in self.languages:
+            self.languages.append(language)
+        return self.languages.index(language)
+
+    def __len__(self) -> int:
+        return len(self.difficulty)
+
+    def select(self, total: int, query: QuestionQuery) -> list[int]:
+        chosen: list[int] = []
+        for category, count in query.quotas:
+            count = min(count, total - len(chosen))
+            chosen.extend(self.pick(count, query.with_category(category), chosen))
+        chosen.extend(self.pick(total - len(chosen), query, chosen))
+
+        shuffle(chosen)
+        return chosen
+
+    def pick(self, total: int, query: QuestionQuery, taken: list[int]) -> list[int]:
+        drivers = self.__drivers(query)
+        size = sum(map(len, drivers))
+        if total <= 0 or size == 0:
+            return []
+
+        bounds = list(accumulate(map(len, drivers)))
+        excluded = set(taken)
+        picked: list[int] = []
+        probed: set[int] = set()
+        for _ in range(4 * total + 64):
+            if len(picked) >= total or len(probed) >= size:
+                return picked
+            position = randrange(size)
+            if position in probed:
+                continue
+            probed.add(position)
+            driver = bisect_right(bounds, position)
+            offset = position - (bounds[driver - 1] if driver else 0)
+            index = drivers[driver][offset]
+            if index not in excluded and self.__accepts(index, query):
+                picked.append(index)
+                excluded.add(index)
+
+        rest = [
+            index
+            for postings in drivers
+            for index in postings
+            if index not in excluded and self.__accepts(index, query)
+        ]
+        return picked + sample(rest, min(total - len(picked), len(rest)))
+
+    def __drivers(self, query: QuestionQuery) -> list[Sequence[int]]:
+        drivers = [
+            [self.postings.get(f"category:{category}", ())]
+            for category in query.categories
+        ]
+        if query.language is not None:
+            drivers.append([self.postings.get(f"language:{query.language}", ())])
+        if query.difficulty is not None:
+            low, high = query.difficulty
+            drivers.append(
+                [
+                    self.postings[term]
+                    for level in range(low, high + 1)
+                    if (term := f"difficulty:{level}") in self.postings
+                ]
+            )
+        if not drivers:
+            return [range(len(self))]
+
+        return min(drivers, key=lambda postings: sum(map(len, postings)))
+
+    def __accepts(self, index: int, query: QuestionQuery) -> bool:
+        if query.difficulty is not None:
+            low, high = query.difficulty
+            if not low <= self.difficulty[index] <= high:
+                return False
+        if query.language is not None and (
+            self.language[index] == NO_LANGUAGE
+            or self.languages[self.language[index]] != query.language
+        ):
+            return False
+        for category in query.categories:
+            posting = self.postings.get(f"category:{category}", ())
+            position = bisect_left(posting, index)
+            if position == len(posting) or posting[position] != index:
+                return False
+        return True
 
 
 @dataclass
 class QuizzRepository:
     _qs: list[Question] = field(default_factory=list)
 
+    _index: QuestionIndex | None = field(default=None, init=False)
+
     def add_questions(self, qs: dict):
-        for q in qs:
-            self._qs.append(Question(**q))
+        self.extend(Question(**q) for q in qs)
+
+    def extend(self, questions: Iterable[Question]) -> None:
+        index = self.index
+        for question in questions:
+            self._qs.append(question)
+            index.add(question.categories, question.difficulty, question.language)
+
+    def derive(self, keep: int, questions: Iterable[Question]) -> "QuizzRepository":
+        repository = QuizzRepository(self._qs[:keep])
+        repository._index = self.index.prefix(keep)
+        repository.extend(questions)
+        return repository
+
+    @property
+    def index(self) -> QuestionIndex:
+        if self._index is None or len(self._index) != self.total:
+            self._index = QuestionIndex()
+            for question in self._qs:
+                self._index.add(
+                    question.categories, question.difficulty, question.language
+                )
+        return self._index
 
     def get_question(self, index: int) -> Question | None:
         if index is None:
@@ -42,8 +430,20 @@ class QuizzRepository:
     def total(self) -> int:
         return len(self._qs)
 
+    def sample(
+        self, total: int, query: QuestionQuery | None = None
+    ) -> "QuizzRepository":
+        if query is None:
+            total = min(total, self.total)
+            selected = sample(self._qs, total)
+        else:
+            selected = [self._qs[i] for i in self.index.select(total, query)]
+
+        return QuizzRepository([replace(q, options=q.options.copy()) for q in selected])
+
     def shoufle(self):
         shuffle(self._qs)
+        self._index = None
 
     def reset(self, total: int = 0):
         total = total | self.total
@@ -56,3 +456,122 @@ class QuizzRepository:
 
     def clear(self):
         self._qs.clear()
+        self._index = None
+
+
+@dataclass
+class CompiledQuizzRepository:
+    path: str
+
+    _map: mmap.mmap | None = field(default=None, init=False)
+    _offsets: memoryview | None = field(default=None, init=False)
+    _data: int = field(default=0, init=False)
+    _total: int = field(default=0, init=False)
+    _index: QuestionIndex | None = field(default=None, init=False)
+    _readers: int = field(default=0, init=False)
+    _closed: bool = field(default=False, init=False)
+    _lock: Lock = field(default_factory=Lock, init=False)
+
+    def __post_init__(self):
+        with open(self.path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, total, meta, directory, size = BANK_HEADER.unpack_from(
+            self._map
+        )
+        if magic != BANK_MAGIC or version != BANK_VERSION:
+            raise ValueError(f"Not a compiled question bank: {self.path}")
+
+        view = memoryview(self._map)
+        start = BANK_HEADER.size
+        self._data = start + (total + 1) * 8
+        self._offsets = view[start : self._data].cast("Q")
+        self._total = total
+
+        layout = json.loads(self._map[directory : directory + size])
+        languages = meta + align(total)
+        postings = languages + align(total * 2)
+        self._index = QuestionIndex(
+            difficulty=view[meta : meta + total],
+            language=view[languages : languages + total * 2].cast("H"),
+            languages=layout["languages"],
+            postings={
+                term: view[
+                    postings + offset * 4 : postings + (offset + length) * 4
+                ].cast("I")
+                for term, (offset, length) in layout["postings"].items()
+            },
+        )
+
+    @property
+    def index(self) -> QuestionIndex:
+        return self._index
+
+    def get_question(self, index: int) -> Question | None:
+        if index is None or not 0 <= index < self._total:
+            return None
+
+        start = self._data + self._offsets[index]
+        end = self._data + self._offsets[index + 1]
+        statement, answer, options, categories, difficulty, language = json.loads(
+            self._map[start:end]
+        )
+        return Question(
+            statement=statement,
+            answer=answer,
+            options=options,
+            categories=categories,
+            difficulty=difficulty,
+            language=language,
+        )
+
+    @property
+    def total(self) -> int:
+        return self._total
+
+    def sample(self, total: int, query: QuestionQuery | None = None) -> QuizzRepository:
+        with self._lock:
+            if self._closed:
+                raise ValueError(f"Question bank is closed: {self.path}")
+            self._readers += 1
+
+        try:
+            if query is None:
+                total = min(total, self._total)
+                selected = sample(range(self._total), total)
+            else:
+                selected = self._index.select(total, query)
+            return QuizzRepository([self.get_question(i) for i in selected])
+        finally:
+            with self._lock:
+                self._readers -= 1
+                release = self._closed and not self._readers
+            if release:
+                self.__release()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            release = not self._readers
+        if release:
+            self.__release()
+
+    def __release(self) -> None:
+        index = self._index
+        for view in (
+            self._offsets,
+            index.difficulty,
+            index.language,
+            *index.postings.values(),
+        ):
+            view.release()
+        self._index = self._offsets = None
+        self._map.close()
+
+
+def align(size: int) -> int:
+    return (size + 7) & ~7
+
+
+QuestionBank = QuizzRepository | CompiledQuizzRepository
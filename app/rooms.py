@@ -0,0 +1,471 @@
+import json
+from bisect import bisect_right
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from functools import partial
+from secrets import choice
+from string import ascii_uppercase, digits
+from threading import Lock
+from time import monotonic, monotonic_ns, time, time_ns
+
+from backends import MemoryBackend, StateBackend
+from flask import Flask, current_app, session
+from journal import CLOSE, RESET, Journal
+from model import Answer, Player, Question
+from repository import PlayerRepository, QuestionBank
+from services import QuestionService, StatusQuestionEnum
+from tools.event_stream import EventHub
+from tools.metrics import REGISTRY
+from tools.scheduler import Scheduler, default_scheduler
+
+CODE_ALPHABET = ascii_uppercase + digits
+DEFAULT_ROOM = "MAIN"
+RESET_CHANNEL = "reset"
+SCORE_CHANNEL = "score"
+BATCHED_RECORDS = frozenset({"register", "answer"})
+
+
+@dataclass(eq=False)
+class Room:
+    code: str
+    service: QuestionService
+    hub: EventHub
+    backend: StateBackend = field(default_factory=MemoryBackend)
+    touched: float = field(default_factory=monotonic)
+
+    _leader: bool = field(default=False, init=False)
+    _renewed: float = field(default=0.0, init=False)
+    _applied: int = field(default=0, init=False)
+    _state: dict | None = field(default=None, init=False)
+    _state_at: float = field(default=0.0, init=False)
+    _ranking: tuple[dict[int, int], list[int]] = field(
+        default_factory=lambda: ({}, []), init=False
+    )
+    _ranking_at: float = field(default=0.0, init=False)
+    _log: list[tuple[str, dict]] = field(default_factory=list, init=False)
+    _lock: Lock = field(default_factory=Lock, init=False)
+    _log_lock: Lock = field(default_factory=Lock, init=False)
+    _flush_lock: Lock = field(default_factory=Lock, init=False)
+
+    RENEW_INTERVAL = 1.0
+    STATE_TTL = 0.2
+
+    def __post_init__(self):
+        if self.backend.shared:
+            self.hub.relay = self.__relay
+            self.service.add_action(self.__save_state, event="wait")
+            self.service.add_action(self.__save_scores, event="score")
+
+    def touch(self) -> None:
+        self.touched = monotonic()
+
+    @property
+    def players(self) -> PlayerRepository:
+        return self.service.players
+
+    @property
+    def idle(self) -> bool:
+        return (
+            self.service.status in (StatusQuestionEnum.NEW, StatusQuestionEnum.END)
+            and self.hub.active == 0
+        )
+
+    @property
+    def leader(self) -> bool:
+        return not self.backend.shared or self._leader
+
+    def lead(self) -> bool:
+        if not self.backend.shared:
+            return True
+
+        with self._lock:
+            if monotonic() - self._renewed < self.RENEW_INTERVAL:
+                return self._leader
+            leader = self.backend.acquire(self.code)
+            if leader and not self._leader:
+                self._applied = 0
+                self.__take_over()
+            elif self._leader and not leader:
+                self.__step_down()
+            self._leader = leader
+            self._renewed = monotonic()
+        return leader
+
+    def state(self) -> dict | None:
+        now = monotonic()
+        if now - self._state_at > self.STATE_TTL:
+            self._state = self.backend.load_state(self.code)
+            self._state_at = now
+        return self._state
+
+    def ranking(self) -> tuple[dict[int, int], list[int]]:
+        now = monotonic()
+        if now - self._ranking_at > self.STATE_TTL:
+            scores = self.backend.scores(self.code)
+            self._ranking = dict(scores), [points for _, points in scores]
+            self._ranking_at = now
+        return self._ranking
+
+    @property
+    def status(self) -> StatusQuestionEnum:
+        if self.leader:
+            return self.service.status
+
+        state = self.state()
+        return StatusQuestionEnum[state["status"]] if state else StatusQuestionEnum.NEW
+
+    @property
+    def remain_time(self) -> int:
+        if self.leader:
+            return self.service.remain_time
+
+        state = self.state()
+        if state is None:
+            return 0
+        tt = state["start_time"] + state["wait_time"] - int(time())
+        return max(tt, 0)
+
+    def waiting_player(self) -> bool:
+        if self.leader:
+            return self.service.waiting_player()
+        return self.status in (StatusQuestionEnum.NEW, StatusQuestionEnum.REGISTER)
+
+    def start(self) -> None:
+        if self.lead():
+            self.service.start()
+        elif self.status == StatusQuestionEnum.NEW:
+            self.backend.append(self.code, "start", {})
+
+    def register(self, player: Player) -> bool:
+        key = player.__hash__()
+        if not self.waiting_player():
+            return False
+        if not self.backend.register(self.code, key, player.nickname, player.avatar):
+            return False
+        if self.leader:
+            return self.service.register(player)
+
+        self.backend.append(
+            self.code,
+            "register",
+            {"nickname": player.nickname, "avatar": player.avatar},
+        )
+        return True
+
+    def get_player(self, key: int | None) -> Player | None:
+        if key is None:
+            return None
+        if self.leader:
+            return self.players.get_player(key)
+
+        row = self.backend.player(self.code, key)
+        return None if row is None else Player(*row)
+
+    def rank_of(self, key: int) -> tuple[int, int] | None:
+        if not self.leader:
+            points, ranking = self.ranking()
+            if key not in points:
+                return None
+            return len(ranking) - bisect_right(ranking, points[key]) + 1, len(ranking)
+
+        rank = self.players.rank_of(key)
+        return None if rank is None else (rank, self.players.total)
+
+    def evaluate(self, key: int, answer: Answer, received_ns: int) -> Question | None:
+        if self.leader:
+            return self.service.evaluate(key, answer, received_ns)
+
+        state = self.state()
+        question = state["question"] if state else None
+        if question is None or question["id"] != answer.question_id:
+            return None
+
+        self.backend.append(
+            self.code,
+            "answer",
+            {
+                "key": key,
+                "question_id": answer.question_id,
+                "option": answer.option,
+                "received_at": time_ns() - (monotonic_ns() - received_ns),
+            },
+        )
+        return Question(**question)
+
+    def configure(self, **settings) -> None:
+        if self.lead():
+            self.__reset(**settings)
+        else:
+            self.service.reset(**settings)
+            self.backend.append(self.code, "reset", settings)
+
+    def apply(self) -> None:
+        if not self.lead():
+            return
+
+        for id, kind, payload in self.backend.commands(self.code, self._applied):
+            self._applied = id
+            if kind == "register":
+                self.service.register(Player(**payload))
+            elif kind == "answer":
+                received_at = payload.pop("received_at")
+                self.service.evaluate(
+                    payload.pop("key"),
+                    Answer(**payload),
+                    monotonic_ns() - (time_ns() - received_at),
+                )
+            elif kind == "start":
+                self.service.start()
+            elif kind == "reset":
+                self.__reset(**payload)
+        self.__flush()
+
+    def receive(self, id: int, channel: str, messages: tuple[bytes, ...]) -> None:
+        if channel == SCORE_CHANNEL:
+            self._ranking_at = 0.0
+        if channel != RESET_CHANNEL:
+            self.hub.deliver(channel, messages, id)
+            return
+
+        self._state_at = 0.0
+        self.hub.forget()
+        if not self.leader:
+            self.service.reset(**json.loads(messages[0]))
+
+    def __reset(self, **settings) -> None:
+        self.service.reset(**settings)
+        self.backend.reset_room(self.code)
+        self.backend.save_state(self.code, self.service.snapshot())
+        self.hub.publish(RESET_CHANNEL, (json.dumps(settings).encode(),))
+        self.hub.forget()
+
+    def __take_over(self) -> None:
+        history = self.backend.history(self.code)
+        for kind, payload in history:
+            self.service.replay(kind, payload)
+        self.service.record = self.__record
+        if history:
+            self.service.resume()
+        else:
+            self.__record(RESET, self.service.checkpoint())
+
+    def __step_down(self) -> None:
+        self.service.record = None
+        with self._log_lock:
+            self._log.clear()
+        self.service.reset(**self.service.checkpoint()["settings"])
+
+    def __record(self, kind: str, payload: dict) -> None:
+        with self._log_lock:
+            self._log.append((kind, payload))
+        if kind not in BATCHED_RECORDS:
+            self.__flush()
+
+    def __flush(self) -> None:
+        with self._flush_lock:
+            with self._log_lock:
+                records, self._log = self._log, []
+            if records:
+                self.backend.record(self.code, records)
+
+    def __relay(self, channel: str, messages: tuple[bytes, ...]) -> None:
+        self.backend.broadcast(self.code, channel, messages)
+
+    def __save_state(self, **kwargs) -> None:
+        self.backend.save_state(self.code, self.service.snapshot())
+
+    def __save_scores(self, **kwargs) -> None:
+        self.backend.save_scores(self.code, self.players.scores())
+
+
+@dataclass
+class RoomRegistry:
+    bank: QuestionBank
+    ttl: float = 600.0
+    code_size: int = 6
+    backend: StateBackend = field(default_factory=MemoryBackend)
+    scheduler: Scheduler = field(default_factory=default_scheduler)
+    journal: Journal | None = None
+
+    _rooms: dict[str, Room] = field(default_factory=dict, init=False)
+    _hooks: list[Callable[[Room], None]] = field(default_factory=list, init=False)
+    _cursor: int = field(default=0, init=False)
+    _recovering: bool = field(default=False, init=False)
+    _recovered: list[Room] = field(default_factory=list, init=False)
+    _lock: Lock = field(default_factory=Lock, init=False)
+
+    def on_create(self, hook: Callable[[Room], None]) -> None:
+        with self._lock:
+            self._hooks.append(hook)
+            rooms = tuple(self._rooms.values())
+
+        for room in rooms:
+            hook(room)
+
+    def create(self, code: str | None = None) -> Room:
+        self.collect()
+
+        with self._lock:
+            if code in self._rooms:
+                return self._rooms[code]
+            service = QuestionService(
+                players=PlayerRepository(),
+                quizz=self.bank.sample(QuestionService.TOTAL_QUESTIONS),
+                bank=self.bank,
+            )
+            while code is None or code in self._rooms:
+                code = "".join(choice(CODE_ALPHABET) for _ in range(self.code_size))
+                if code in self._rooms or not self.backend.create_room(code):
+                    code = None
+            room = self._rooms[code] = Room(
+                code=code, service=service, hub=EventHub(), backend=self.backend
+            )
+            hooks = tuple(self._hooks)
+
+        if self.journal is not None and not self._recovering:
+            self.__journal(room)
+            self.journal.append(code, RESET, service.checkpoint())
+
+        for hook in hooks:
+            hook(room)
+        return room
+
+    def use_bank(self, bank: QuestionBank) -> None:
+        with self._lock:
+            self.bank = bank
+            rooms = tuple(self._rooms.values())
+
+        for room in rooms:
+            room.service.bank = bank
+
+    def get(self, code: str | None) -> Room | None:
+        room = self._rooms.get(code) if code else None
+        if room is None and code and self.backend.has_room(code):
+            room = self.create(code)
+        if room is not None:
+            room.touch()
+        return room
+
+    @property
+    def default(self) -> Room:
+        return self._rooms[DEFAULT_ROOM]
+
+    def __iter__(self):
+        return iter(tuple(self._rooms.values()))
+
+    def __len__(self) -> int:
+        return len(self._rooms)
+
+    def collect(self) -> int:
+        deadline = monotonic() - self.ttl
+        with self._lock:
+            expired = [
+                code
+                for code, room in self._rooms.items()
+                if code != DEFAULT_ROOM and room.touched < deadline and room.idle
+            ]
+            for code in expired:
+                del self._rooms[code]
+
+        if self.journal is not None:
+            for code in expired:
+                self.journal.append(code, CLOSE, {})
+        return len(expired)
+
+    def recover(self) -> int:
+        recovered: dict[str, Room] = {}
+        self._recovering = True
+        try:
+            for code, kind, payload in self.journal.replay():
+                if kind == CLOSE:
+                    recovered.pop(code, None)
+                    with self._lock:
+                        self._rooms.pop(code, None)
+                    continue
+                room = recovered.get(code)
+                if room is None:
+                    room = recovered[code] = self.create(code)
+                room.service.replay(kind, payload)
+        finally:
+            self._recovering = False
+
+        self._recovered = list(recovered.values())
+        return len(recovered)
+
+    def resume(self) -> None:
+        rooms, self._recovered = self._recovered, []
+        for room in rooms:
+            self.__journal(room)
+            room.service.resume()
+
+    def __journal(self, room: Room) -> None:
+        room.service.record = partial(self.journal.append, room.code)
+
+    def sync(self) -> None:
+        for id, code, channel, messages in self.backend.events(self._cursor):
+            self._cursor = id
+            room = self.get(code)
+            if room is not None:
+                room.receive(id, channel, messages)
+
+        for room in self:
+            room.apply()
+
+    def __poll(self) -> None:
+        try:
+            self.sync()
+        finally:
+            self.scheduler.call_later(self.backend.interval, self.__poll)
+
+    def init_app(self, app: Flask) -> None:
+        app.extensions["rooms"] = self
+
+        self.backend.create_room(DEFAULT_ROOM)
+        if self.journal is not None:
+            self.recover()
+        room = self._rooms.get(DEFAULT_ROOM) or self.create(DEFAULT_ROOM)
+        room.service.init_app(app)
+        room.hub.init_app(app)
+        app.extensions["repo"] = room.players
+
+        if self.backend.shared:
+            self._cursor = self.backend.last_event()
+            self.scheduler.call_soon(self.__poll)
+
+        REGISTRY.gauge("quizz_rooms", "Open rooms", collect=lambda: [((), len(self))])
+        REGISTRY.gauge(
+            "quizz_players",
+            "Registered players per room",
+            ("room",),
+            lambda: [((room.code,), room.players.total) for room in self],
+        )
+        REGISTRY.gauge(
+            "quizz_subscribers",
+            "Connected event stream subscribers per room",
+            ("room",),
+            lambda: [((room.code,), room.hub.active) for room in self],
+        )
+        REGISTRY.gauge(
+            "quizz_queued_messages",
+            "Messages waiting in subscriber queues per room",
+            ("room",),
+            lambda: [((room.code,), room.hub.metrics["pending"]) for room in self],
+        )
+        REGISTRY.counter(
+            "quizz_hub_messages_total",
+            "Messages handled by the event hubs",
+            ("room", "outcome"),
+            self.__hub_messages,
+        )
+
+    def __hub_messages(self) -> list[tuple[tuple[str, str], int]]:
+        return [
+            ((room.code, outcome), room.hub.metrics.get(outcome, 0))
+            for room in self
+            for outcome in ("delivered", "coalesced", "dropped", "disconnected")
+        ]
+
+
+def current_room() -> Room:
+    rooms: RoomRegistry = current_app.extensions["rooms"]
+    return rooms.get(session.get("room")) or rooms.default
@@ -0,0 +1,47 @@
+import argparse
+import os
+import tempfile
+from uuid import uuid4
+
+import uvicorn
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve Fast Punch on an event loop")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--keep-alive", type=int, default=5)
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--state", help="Shared state, e.g. sqlite:///tmp/punch.db")
+    parser.add_argument("--journal", help="Game journal to recover from after a crash")
+    args = parser.parse_args()
+
+    state = args.state or os.environ.get("FAST_PUNCH_STATE")
+    if state is None and args.workers > 1:
+        fd, path = tempfile.mkstemp(prefix="fast-punch-", suffix=".db")
+        os.close(fd)
+        state = f"sqlite://{path}"
+
+    os.environ["FAST_PUNCH_THREADS"] = str(args.threads)
+    os.environ.setdefault("FAST_PUNCH_SECRET", uuid4().hex)
+    if state:
+        os.environ["FAST_PUNCH_STATE"] = state
+    if args.journal:
+        os.environ["FAST_PUNCH_JOURNAL"] = args.journal
+    uvicorn.run(
+        "asgi:application",
+        app_dir=APP_DIR,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_keep_alive=args.keep_alive,
+        backlog=args.backlog,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,30 @@
-from collections.abc import Callable, Iterable
+from collections.abc import Callable
 from dataclasses import dataclass, field
 from enum import IntEnum, auto
 from functools import partial
-from threading import Thread
-from time import sleep, time
+from itertools import count
+from threading import Lock, RLock
+from time import perf_counter
 from typing import Literal
 
+from analytics import NO_OPTION, AnswerColumns
 from flask import Flask
-from model import Answer, Question
-from repository import PlayerRepository, QuizzRepository
+from model import Answer, Player, Question
+from repository import PlayerRepository, QuestionBank, QuestionQuery, QuizzRepository
+from tools.clock import Clock
+from tools.metrics import REGISTRY
+from tools.scheduler import Scheduler, Timer, default_scheduler
+from tools.throttle import ThrottledPublisher
+
+PHASE_SECONDS = REGISTRY.histogram(
+    "quizz_phase_seconds", "Time spent running the actions of a game phase", ("event",)
+)
+TRANSITIONS = REGISTRY.counter(
+    "quizz_phase_transitions_total", "Game status transitions", ("status",)
+)
+EVALUATE_SECONDS = REGISTRY.histogram(
+    "quizz_evaluate_seconds", "Time spent evaluating an answer", ("outcome",)
+)
 
 
 class StatusQuestionEnum(IntEnum):
@@ -20,31 +36,156 @@ class StatusQuestionEnum(IntEnum):
     END = auto()
 
 
+@dataclass
+class AnswerIngestor:
+    award: Callable[[int, int], None]
+    stripes: int = 16
+
+    __locks: tuple[Lock, ...] = field(init=False, default=())
+    __questions: dict[str, int] = field(init=False, default_factory=dict)
+    __answered: list[bytearray] = field(init=False, default_factory=list)
+    __counts: tuple[dict[int, int], ...] = field(init=False, default=())
+    __results: tuple[AnswerColumns, ...] = field(init=False, default=())
+    __grow: Lock = field(init=False, default_factory=Lock)
+
+    def __post_init__(self):
+        self.__locks = tuple(Lock() for _ in range(self.stripes))
+        self.__results = tuple(AnswerColumns() for _ in range(self.stripes))
+        self.__counts = tuple({} for _ in range(self.stripes))
+
+    def submit(
+        self,
+        id: int,
+        question: Question,
+        option: str,
+        points: int,
+        latency_ns: int = 0,
+    ) -> bool:
+        index, answered = self.__flags(question.id, id)
+        stripe = id % self.stripes
+        with self.__locks[stripe]:
+            if answered[id]:
+                return False
+            answered[id] = 1
+            counts = self.__counts[stripe]
+            counts[index] = counts.get(index, 0) + 1
+
+            correct = question.check_answer(option)
+            if not correct:
+                points = 0
+            if points:
+                self.award(id, points)
+            question.add_answer(option, stripe)
+            self.__results[stripe].append(
+                index,
+                id,
+                question.options.index(option)
+                if option in question.options
+                else NO_OPTION,
+                correct,
+                latency_ns,
+                points,
+            )
+
+        return True
+
+    def __flags(self, question: str, id: int) -> tuple[int, bytearray]:
+        index = self.__questions.get(question)
+        if index is None or id >= len(self.__answered[index]):
+            with self.__grow:
+                index = self.__questions.setdefault(question, len(self.__answered))
+                if index == len(self.__answered):
+                    self.__answered.append(bytearray())
+                answered = self.__answered[index]
+                if id >= len(answered):
+                    answered.extend(
+                        bytes(max(id + 1, 2 * len(answered)) - len(answered))
+                    )
+        return index, self.__answered[index]
+
+    def answered(self, question: str) -> int:
+        index = self.__questions.get(question)
+        if index is None:
+            return 0
+        return sum(counts.get(index, 0) for counts in self.__counts)
+
+    def results(self) -> tuple[list[str], AnswerColumns]:
+        with self.__grow:
+            questions = list(self.__questions)
+        columns = AnswerColumns()
+        for lock, results in zip(self.__locks, self.__results):
+            with lock:
+                columns.extend(results)
+        return questions, columns
+
+    def reset(self) -> None:
+        with self.__grow:
+            self.__questions.clear()
+            self.__answered.clear()
+        for lock, results, counts in zip(self.__locks, self.__results, self.__counts):
+            with lock:
+                results.clear()
+                counts.clear()
+
+
 @dataclass
 class QuestionService:
     players: PlayerRepository
     quizz: QuizzRepository
+    bank: QuestionBank | None = None
+    scheduler: Scheduler = field(default_factory=default_scheduler)
+    clock: Clock = field(default_factory=Clock)
+    record: Callable[[str, dict], None] | None = None
 
     status: StatusQuestionEnum = field(default=StatusQuestionEnum.NEW)
     _current_question: int | None = None
     _start_time: int = 0
     _wait_time: int = 0
-    __thread: Thread | None = None
+    _version: int = 0
+    _question_sent_ns: int = 0
+    __versions: count = field(default_factory=lambda: count(1), init=False)
+    __timer: Timer | None = field(default=None, init=False)
+    __pending: int | None = field(default=None, init=False)
+    __generation: int = field(default=0, init=False)
+    __lock: RLock = field(default_factory=RLock, init=False)
     __question_actions: list[Callable] = field(default_factory=list)
     __answer_graphic_actions: list[Callable] = field(default_factory=list)
     __wait_actions: list[Callable] = field(default_factory=list)
     __score_actions: list[Callable] = field(default_factory=list)
     __end_actions: list[Callable] = field(default_factory=list)
+    __graphic: ThrottledPublisher | None = field(default=None, init=False)
+    answers: AnswerIngestor = field(init=False)
 
     QUESTION_TIME: int = 30
     SCORE_TIME: int = 10
     PLAYERS_TIME: int = 10
     TOTAL_QUESTIONS: int = 10
+    GRAPHIC_INTERVAL: float = 0.25
+    SCORE_TOP: int = 10
+    POINT_SCALE: int = 25
+    FILTERS: str = ""
+    QUOTAS: str = ""
+
+    def __post_init__(self):
+        self.answers = AnswerIngestor(award=self.players.add_point)
+        self.__graphic = ThrottledPublisher(
+            publish=self.__run_graphic_actions,
+            interval=self.GRAPHIC_INTERVAL,
+            scheduler=self.scheduler,
+            clock=self.clock,
+        )
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def __bump_version(self) -> None:
+        self._version = next(self.__versions)
 
     @property
     def remain_time(self) -> int:
-        tt = self._start_time + self._wait_time - int(time())
-        return tt if tt > 0 else 0
+        tt = self._start_time + self._wait_time - int(self.clock.time())
+        return max(tt, 0)
 
     def waiting_player(self) -> bool:
         return self.status == StatusQuestionEnum.REGISTER
@@ -53,32 +194,94 @@ class QuestionService:
         return self.quizz.get_question(self._current_question)
 
     def start(self) -> None:
-        if self.status != StatusQuestionEnum.NEW:
-            return
+        with self.__lock:
+            if self.status != StatusQuestionEnum.NEW or not self.TOTAL_QUESTIONS:
+                return
 
-        self.__thread = self.__on_thread(
-            actions=[
+            actions = [
                 partial(self.set_status, StatusQuestionEnum.REGISTER),
                 partial(self.__waiting, self.PLAYERS_TIME),
-                partial(self.set_status, StatusQuestionEnum.RUNING),
-                *self.__start_quizz(),
-                partial(self.set_status, StatusQuestionEnum.END),
-                self.__run_score_actions,
-                partial(self.__waiting, 2),
-                partial(self.__runner, self.__end_actions),
-            ],
-        )
-        self.__thread.start()
-
-    def __start_quizz(self) -> list[Callable]:
+                *self.__game(0),
+            ]
+            self.__step(actions, 0, self.__generation)
+
+    def resume(self) -> None:
+        with self.__lock:
+            if self.status == StatusQuestionEnum.REGISTER:
+                actions = [partial(self.__waiting, self.PLAYERS_TIME), *self.__game(0)]
+            elif self.status in (
+                StatusQuestionEnum.RUNING,
+                StatusQuestionEnum.QUESTION,
+                StatusQuestionEnum.WAITNG,
+            ):
+                first = self._current_question
+                if first is None:
+                    first = 0
+                elif self.status != StatusQuestionEnum.QUESTION:
+                    first += 1
+                self._current_question = first - 1 if first else None
+                actions = self.__game(first)
+            else:
+                return
+            self.__step(actions, 0, self.__generation)
+
+    def __game(self, first: int) -> list[Callable]:
+        return [
+            partial(self.set_status, StatusQuestionEnum.RUNING),
+            *self.__start_quizz(first),
+            partial(self.set_status, StatusQuestionEnum.END),
+            self.__run_score_actions,
+            partial(self.__waiting, 2),
+            partial(self.__runner, "end"),
+        ]
+
+    def __step(self, actions: list[Callable], index: int, generation: int) -> None:
+        while index < len(actions):
+            if generation != self.__generation:
+                return
+
+            delay = actions[index]()
+            index += 1
+            if delay is not None:
+                with self.__lock:
+                    if generation == self.__generation:
+                        self.__pending = index
+                        self.__timer = self.scheduler.call_later(
+                            delay, partial(self.__resume, actions, index, generation)
+                        )
+                if self.__all_answered(self.get_question()):
+                    self.advance()
+                return
+
+    def __resume(self, actions: list[Callable], index: int, generation: int) -> None:
+        with self.__lock:
+            if generation != self.__generation or self.__pending != index:
+                return
+            self.__pending = None
+            self.__timer = None
+
+        self.__step(actions, index, generation)
+
+    def advance(self) -> bool:
+        with self.__lock:
+            if self.__pending is None:
+                return False
+
+            self.__timer.cancel()
+            self._wait_time = 0
+            self.__timer = self.scheduler.call_soon(self.__timer.callback)
+        return True
+
+    def __start_quizz(self, first: int = 0) -> list[Callable]:
         actions = []
-        for i in range(self.TOTAL_QUESTIONS):
+        for i in range(first, self.TOTAL_QUESTIONS):
             actions.extend(
                 [
                     partial(self.set_status, StatusQuestionEnum.QUESTION),
                     self.__next_question,
                     self.__run_question_actions,
                     partial(self.__waiting, self.QUESTION_TIME),
+                    self.__graphic.flush,
                     partial(self.set_status, StatusQuestionEnum.RUNING),
                     self.__run_score_actions,
                     partial(self.__waiting, self.SCORE_TIME, False),
@@ -98,132 +301,297 @@ class QuestionService:
         else:
             self.status = StatusQuestionEnum.END
 
+        self.__bump_version()
+        self.__record("question", {"index": self._current_question})
+
+    def __actions(self, event: str) -> list[Callable]:
+        return {
+            "question": self.__question_actions,
+            "graphic": self.__answer_graphic_actions,
+            "wait": self.__wait_actions,
+            "score": self.__score_actions,
+            "end": self.__end_actions,
+        }[event]
+
     def add_action(
         self,
         action: Callable,
         event: Literal["question", "graphic", "wait", "score", "end"],
     ) -> None:
-        if event == "question" and action not in self.__question_actions:
-            self.__question_actions.append(action)
-        elif event == "graphic" and action not in self.__answer_graphic_actions:
-            self.__answer_graphic_actions.append(action)
-        elif event == "wait" and action not in self.__wait_actions:
-            self.__wait_actions.append(action)
-        elif event == "score" and action not in self.__score_actions:
-            self.__score_actions.append(action)
-        elif event == "end" and action not in self.__end_actions:
-            self.__end_actions.append(action)
+        actions = self.__actions(event)
+        if action not in actions:
+            actions.append(action)
 
     def __run_question_actions(self) -> None:
         question = self.get_question()
         if question is None:
             return
 
+        self._question_sent_ns = self.clock.monotonic_ns()
         self.__runner(
-            self.__question_actions,
+            "question",
+            version=self.version,
             question=question,
             waiting=self.QUESTION_TIME,
         )
 
+    def __run_graphic_actions(self) -> None:
+        question = self.get_question()
+        if question is None:
+            return
+
+        self.__runner(
+            "graphic",
+            version=self.version,
+            question=question,
+        )
+
     def __run_score_actions(self) -> None:
-        players = self.players.players_by_points()
+        if self._current_question is None:
+            return
+        players = self.players.top(self.SCORE_TOP)
 
         self.__runner(
-            self.__score_actions,
+            "score",
+            version=self.version,
             players=players,
             current=self._current_question + 1,
             total=self.TOTAL_QUESTIONS,
             status=self.status.name,
         )
 
-    def __runner(self, actions: list[Callable], **kwargs) -> None:
-        for act in actions:
-            act(**kwargs)
+    def __runner(self, event: str, **kwargs) -> None:
+        with PHASE_SECONDS.labels(event).time():
+            for act in tuple(self.__actions(event)):
+                act(**kwargs)
 
-    def __waiting(self, seconds: int, in_wait: bool = True) -> None:
-        self._start_time = int(time())
+    def __waiting(self, seconds: int, in_wait: bool = True) -> int:
+        self._start_time = int(self.clock.time())
         self._wait_time = seconds if in_wait else 0
-        sleep(seconds)
-
-    def __on_thread(self, actions: Iterable[Callable], execute: bool = False) -> Thread:
-        thread = Thread(
-            target=self.__runner,
-            args=(actions,),
-            daemon=True,
-        )
+        self.__runner("wait", status=self.status.name, waiting=seconds)
+        return seconds
 
-        if execute:
-            thread.start()
-        return thread
+    def snapshot(self) -> dict:
+        question = self.get_question()
+        return {
+            "status": self.status.name,
+            "start_time": self._start_time,
+            "wait_time": self._wait_time,
+            "question": None
+            if question is None
+            else {
+                "id": question.id,
+                "statement": question.statement,
+                "answer": question.answer,
+                "options": question.options,
+            },
+        }
 
     def set_status(self, status: StatusQuestionEnum, validator: bool = True) -> None:
         if validator:
             self.status = status
+            self.__bump_version()
+            TRANSITIONS.labels(status.name).inc()
+            self.__record("status", {"status": status.name})
+
+    def register(self, player: Player) -> bool:
+        if not self.waiting_player() or not self.players.add_player(player):
+            return False
+        self.__record(
+            "register", {"nickname": player.nickname, "avatar": player.avatar}
+        )
+        return True
 
     @property
     def is_end(self) -> bool:
         return self.status == StatusQuestionEnum.END
 
-    def evaluate(self, player: str, answer: Answer) -> Question | None:
-        player = self.players.get_player(player)
-        if player is None:
+    def evaluate(
+        self, key: int, answer: Answer, received_ns: int | None = None
+    ) -> Question | None:
+        start = perf_counter()
+        question = self.__evaluate(key, answer, received_ns)
+        outcome = "rejected" if question is None else "accepted"
+        EVALUATE_SECONDS.labels(outcome).observe(perf_counter() - start)
+        return question
+
+    def __evaluate(
+        self, key: int, answer: Answer, received_ns: int | None
+    ) -> Question | None:
+        if received_ns is None:
+            received_ns = self.clock.monotonic_ns()
+
+        id = self.players.id_of(key)
+        if id is None:
             return
         question = self.quizz.get_question(self._current_question)
         if question is None or question.id != answer.question_id:
             return
 
-        is_right = question.check_answer(answer.option)
-        multiple_point = self.multiple_point()
-        if is_right:
-            player.add_point(multiple_point)
-        question.add_answer(answer.option)
-
-        self.__on_thread(
-            actions=[
-                partial(
-                    self.__runner,
-                    self.__answer_graphic_actions,
-                    question=question,
-                ),
-            ],
-            execute=True,
+        latency_ns = max(0, received_ns - self._question_sent_ns)
+        points = self.multiple_point(latency_ns)
+        if not self.answers.submit(id, question, answer.option, points, latency_ns):
+            return
+        self.__record(
+            "answer",
+            {
+                "key": key,
+                "question": question.id,
+                "option": answer.option,
+                "points": points,
+                "latency_ns": latency_ns,
+            },
         )
+        self.__bump_version()
+        self.__graphic.mark()
+
+        if self.__all_answered(question):
+            self.advance()
+
         return question
 
-    def multiple_point(self) -> int:
-        if self.remain_time <= 0:
-            return 0
+    def __all_answered(self, question: Question | None) -> bool:
+        return (
+            self.status == StatusQuestionEnum.QUESTION
+            and question is not None
+            and self.players.total > 0
+            and self.answers.answered(question.id) >= self.players.total
+        )
 
-        if self.remain_time > self.QUESTION_TIME * 0.95:
-            return 4
-        elif self.remain_time > self.QUESTION_TIME * 0.85:
-            return 3
-        elif self.remain_time > self.QUESTION_TIME * 0.50:
-            return 2
+    def multiple_point(self, latency_ns: int) -> int:
+        window = self.QUESTION_TIME * 1_000_000_000
+        if window <= 0 or latency_ns >= window:
+            return 0
 
-        return 1
+        remaining = 1 - latency_ns / window
+        return round(self.POINT_SCALE * (1 + 3 * remaining))
 
     def init_app(self, app: Flask) -> None:
         app.extensions["question_service"] = self
 
     def reset(
-        self, total: int = 10, qtime: int = 30, stime: int = 10, ptime: int = 10
+        self,
+        total: int = 10,
+        qtime: int = 30,
+        stime: int = 10,
+        ptime: int = 10,
+        filters: str = "",
+        quotas: str = "",
     ) -> None:
+        query = QuestionQuery.parse(filters, quotas) if filters or quotas else None
+        if query is not None:
+            if self.bank is None:
+                raise ValueError("Question filters need a question bank")
+            quizz = self.bank.sample(total, query)
+            if not quizz.total:
+                raise ValueError("No question matches the filters")
+
+        self.__clear()
+        if query is not None:
+            self.quizz = quizz
+        elif self.bank is not None:
+            self.quizz = self.bank.sample(total)
+        else:
+            self.quizz.reset(self.TOTAL_QUESTIONS)
+        self.__configure(total, qtime, stime, ptime, filters, quotas)
+        self.__record("reset", self.checkpoint())
+
+    def __clear(self) -> None:
+        with self.__lock:
+            self.__generation += 1
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+            self.__pending = None
+
         self.status = StatusQuestionEnum.NEW
         self._current_question = None
         self._start_time = 0
         self._wait_time = 0
-        self.__thread = None
-        self.__question_actions.clear()
-        self.__answer_graphic_actions.clear()
-        self.__wait_actions.clear()
+        self.__graphic.discard()
+        self.answers.reset()
+        self.__bump_version()
         self.players.reset()
-        self.quizz.reset(self.TOTAL_QUESTIONS)
 
-        if total > self.quizz.total:
-            total = self.quizz.total
+    def __configure(
+        self,
+        total: int,
+        qtime: int,
+        stime: int,
+        ptime: int,
+        filters: str,
+        quotas: str,
+    ) -> None:
+        total = min(total, self.quizz.total)
 
         self.QUESTION_TIME = qtime
         self.SCORE_TIME = stime
         self.PLAYERS_TIME = ptime
         self.TOTAL_QUESTIONS = total
+        self.FILTERS = filters
+        self.QUOTAS = quotas
+
+    def checkpoint(self) -> dict:
+        return {
+            "settings": {
+                "total": self.TOTAL_QUESTIONS,
+                "qtime": self.QUESTION_TIME,
+                "stime": self.SCORE_TIME,
+                "ptime": self.PLAYERS_TIME,
+                "filters": self.FILTERS,
+                "quotas": self.QUOTAS,
+            },
+            "questions": self.questions(),
+        }
+
+    def questions(self) -> list[dict]:
+        return [
+            {
+                "id": question.id,
+                "statement": question.statement,
+                "answer": question.answer,
+                "options": question.options,
+                "categories": question.categories,
+                "difficulty": question.difficulty,
+                "language": question.language,
+            }
+            for question in map(self.quizz.get_question, range(self.quizz.total))
+        ]
+
+    def replay(self, kind: str, payload: dict) -> None:
+        if kind == "reset":
+            self.__clear()
+            self.quizz = QuizzRepository([Question(**q) for q in payload["questions"]])
+            self.__configure(**payload["settings"])
+        elif kind == "register":
+            self.players.add_player(Player(**payload))
+        elif kind == "status":
+            self.status = StatusQuestionEnum[payload["status"]]
+            self.__bump_version()
+        elif kind == "question":
+            self._current_question = payload["index"]
+            self.__bump_version()
+        elif kind == "answer":
+            id = self.players.id_of(payload["key"])
+            question = next(
+                (
+                    question
+                    for question in map(
+                        self.quizz.get_question, range(self.quizz.total)
+                    )
+                    if question.id == payload["question"]
+                ),
+                None,
+            )
+            if id is not None and question is not None:
+                self.answers.submit(
+                    id,
+                    question,
+                    payload["option"],
+                    payload["points"],
+                    payload["latency_ns"],
+                )
+
+    def __record(self, kind: str, payload: dict) -> None:
+        if self.record is not None:
+            self.record(kind, payload)
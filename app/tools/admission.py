@@ -0,0 +1,96 @@
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from functools import wraps
+from http import HTTPStatus
+from threading import Condition
+from time import perf_counter
+
+from flask import Flask, Response, current_app
+from tools.metrics import REGISTRY
+
+ADMISSIONS = REGISTRY.counter(
+    "quizz_admission_total", "Requests through the admission gate", ("outcome",)
+)
+ADMITTED = ADMISSIONS.labels("admitted")
+REJECTED = ADMISSIONS.labels("rejected")
+TIMED_OUT = ADMISSIONS.labels("timeout")
+WAIT_SECONDS = REGISTRY.histogram(
+    "quizz_admission_wait_seconds", "Time spent queued at the admission gate"
+).labels()
+
+
+@dataclass
+class AdmissionGate:
+    limit: int = 4
+    queue: int = 16
+    timeout: float = 1.0
+    retry_after: int = 1
+
+    _active: int = field(default=0, init=False)
+    _waiting: int = field(default=0, init=False)
+    _condition: Condition = field(default_factory=Condition, init=False)
+
+    def acquire(self) -> bool:
+        start = perf_counter()
+        with self._condition:
+            if self._active >= self.limit:
+                if self._waiting >= self.queue:
+                    REJECTED.inc()
+                    return False
+                self._waiting += 1
+                try:
+                    admitted = self._condition.wait_for(
+                        lambda: self._active < self.limit, self.timeout
+                    )
+                finally:
+                    self._waiting -= 1
+                if not admitted:
+                    TIMED_OUT.inc()
+                    return False
+            self._active += 1
+
+        WAIT_SECONDS.observe(perf_counter() - start)
+        ADMITTED.inc()
+        return True
+
+    def release(self) -> None:
+        with self._condition:
+            self._active -= 1
+            self._condition.notify()
+
+    def reject(self) -> Response:
+        response = Response(
+            "Too many players joining, retrying…", HTTPStatus.SERVICE_UNAVAILABLE
+        )
+        response.retry_after = self.retry_after
+        response.cache_control.no_store = True
+        return response
+
+    def init_app(self, app: Flask) -> None:
+        app.extensions["admission"] = self
+        REGISTRY.gauge(
+            "quizz_admission_active",
+            "Requests running behind the admission gate",
+            collect=lambda: [((), self._active)],
+        )
+        REGISTRY.gauge(
+            "quizz_admission_waiting",
+            "Requests queued at the admission gate",
+            collect=lambda: [((), self._waiting)],
+        )
+
+
+def admitted(view: Callable) -> Callable:
+    @wraps(view)
+    def gated(*args, **kwargs):
+        gate: AdmissionGate | None = current_app.extensions.get("admission")
+        if gate is None:
+            return view(*args, **kwargs)
+        if not gate.acquire():
+            return gate.reject()
+        try:
+            return view(*args, **kwargs)
+        finally:
+            gate.release()
+
+    return gated
@@ -1,23 +1,57 @@
-from functools import cache
-from os import listdir
-from os.path import isfile, join
+from hashlib import blake2b
+from os import scandir
+from os.path import join
 
-from flask import url_for
+from flask import render_template, url_for
 from model import Avatar
 
 image_extensions = (".svg", ".png", ".jpeg", ".jpg")
+avatar_folder = "avatars"
+
+_avatars: dict[str, tuple[str, list[Avatar]]] = {}
+_galleries: dict[str, tuple[str, str]] = {}
+
+
+def avatar_files(app_path: str) -> list[tuple[str, int, int]]:
+    files = []
+    with scandir(join(app_path, avatar_folder)) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith(image_extensions):
+                info = entry.stat()
+                files.append((entry.name, info.st_mtime_ns, info.st_size))
+    return sorted(files)
+
+
+def avatars_version(app_path: str, files: list | None = None) -> str:
+    if files is None:
+        files = avatar_files(app_path)
+    return blake2b(repr(files).encode(), digest_size=8).hexdigest()
 
 
-@cache
 def load_avatars(app_path: str) -> list[Avatar]:
-    avatar_folder = "avatars"
-    full_path = join(app_path, avatar_folder)
+    files = avatar_files(app_path)
+    version = avatars_version(app_path, files)
+    cached = _avatars.get(app_path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
 
-    return [
+    avatars = [
         Avatar(
-            file=f"{avatar_folder}/{f}",
-            url=url_for("static", filename=f"{avatar_folder}/{f}"),
+            file=f"{avatar_folder}/{name}",
+            url=url_for("static", filename=f"{avatar_folder}/{name}"),
         )
-        for f in sorted(listdir(full_path))
-        if isfile(join(full_path, f)) and f.endswith(image_extensions)
+        for name, _, _ in files
     ]
+    _avatars[app_path] = (version, avatars)
+    return avatars
+
+
+def avatar_gallery(app_path: str) -> tuple[str, str]:
+    version = avatars_version(app_path)
+    cached = _galleries.get(app_path)
+    if cached is None or cached[0] != version:
+        gallery = render_template(
+            "components/avatar_galery.html", avatars=load_avatars(app_path)
+        )
+        cached = _galleries[app_path] = (version, gallery)
+    return cached
@@ -0,0 +1,163 @@
+import logging
+import os
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from os.path import isfile, join
+from threading import Lock
+
+from flask import Flask
+from model import Question
+from repository import CompiledQuizzRepository, QuestionBank, QuizzRepository
+from tools.load_default import (
+    BANK_FILE,
+    FileReport,
+    log_report,
+    question_files,
+    read_files,
+)
+from tools.metrics import REGISTRY
+from tools.scheduler import Scheduler, default_scheduler
+
+logger = logging.getLogger("quizz.questions")
+
+
+@dataclass(eq=False)
+class Segment:
+    path: str
+    signature: tuple[int, int]
+    report: FileReport
+    keys: list[bytes] = field(default_factory=list)
+    questions: list[Question] = field(default_factory=list)
+
+
+@dataclass
+class BankWatcher:
+    path: str
+    interval: float = 2.0
+    workers: int | None = None
+    scheduler: Scheduler = field(default_factory=default_scheduler)
+
+    _bank: QuestionBank | None = field(default=None, init=False)
+    _segments: list[Segment] = field(default_factory=list, init=False)
+    _compiled: tuple[int, int] | None = field(default=None, init=False)
+    _hooks: list[Callable[[QuestionBank], None]] = field(
+        default_factory=list, init=False
+    )
+    _lock: Lock = field(default_factory=Lock, init=False)
+
+    @property
+    def bank(self) -> QuestionBank:
+        if self._bank is None:
+            self.reload()
+        return self._bank
+
+    def on_reload(self, hook: Callable[[QuestionBank], None]) -> None:
+        self._hooks.append(hook)
+
+    def reload(self) -> bool:
+        with self._lock:
+            compiled = join(self.path, BANK_FILE)
+            if isfile(compiled):
+                bank = self.__open(compiled)
+            else:
+                bank = self.__assemble()
+            if bank is None:
+                return False
+            previous, self._bank = self._bank, bank
+            hooks = tuple(self._hooks)
+
+        logger.info("question bank reloaded: %d questions", bank.total)
+        for hook in hooks:
+            hook(bank)
+        if isinstance(previous, CompiledQuizzRepository):
+            previous.close()
+        return True
+
+    def __open(self, path: str) -> CompiledQuizzRepository | None:
+        signature = self.__signature(path)
+        if signature == self._compiled and self._bank is not None:
+            return None
+
+        bank = CompiledQuizzRepository(path)
+        self._compiled = signature
+        self._segments = []
+        return bank
+
+    def __assemble(self) -> QuizzRepository | None:
+        signatures = {
+            path: self.__signature(path) for path in question_files(self.path)
+        }
+        paths = list(signatures)
+
+        keep = 0
+        if isinstance(self._bank, QuizzRepository):
+            for segment, path in zip(self._segments, paths):
+                if segment.path != path or segment.signature != signatures[path]:
+                    break
+                keep += 1
+            if keep == len(paths) == len(self._segments):
+                return None
+
+        cached = {
+            s.path: s for s in self._segments if s.signature == signatures.get(s.path)
+        }
+        changed = [path for path in paths[keep:] if path not in cached]
+        for entries, report in read_files(changed, self.workers):
+            segment = cached[report.file] = Segment(
+                path=report.file, signature=signatures[report.file], report=report
+            )
+            for key, entry in entries:
+                segment.keys.append(key)
+                segment.questions.append(Question(**entry))
+
+        segments = self._segments[:keep]
+        seen = {key for segment in segments for key in segment.keys}
+        questions: list[Question] = []
+        for path in paths[keep:]:
+            segment = cached[path]
+            report = segment.report
+            report.loaded = report.duplicated = 0
+            for key, question in zip(segment.keys, segment.questions):
+                if key in seen:
+                    report.duplicated += 1
+                    continue
+                seen.add(key)
+                report.loaded += 1
+                questions.append(question)
+            segments.append(segment)
+            if path in changed:
+                log_report(report)
+
+        if keep:
+            kept = sum(segment.report.loaded for segment in segments[:keep])
+            bank = self._bank.derive(kept, questions)
+        else:
+            bank = QuizzRepository()
+            bank.extend(questions)
+
+        self._segments = segments
+        self._compiled = None
+        return bank
+
+    @staticmethod
+    def __signature(path: str) -> tuple[int, int]:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def __poll(self) -> None:
+        try:
+            self.reload()
+        except (OSError, ValueError):
+            logger.exception("question bank reload failed")
+        finally:
+            self.scheduler.call_later(self.interval, self.__poll)
+
+    def init_app(self, app: Flask) -> None:
+        app.extensions["bank"] = self
+        REGISTRY.gauge(
+            "quizz_bank_questions",
+            "Questions in the current bank",
+            collect=lambda: [((), self.bank.total)],
+        )
+        if self.interval > 0:
+            self.scheduler.call_later(self.interval, self.__poll)
@@ -0,0 +1,31 @@
+from dataclasses import dataclass
+from time import monotonic, monotonic_ns, time
+
+
+@dataclass
+class Clock:
+    def time(self) -> float:
+        return time()
+
+    def monotonic(self) -> float:
+        return monotonic()
+
+    def monotonic_ns(self) -> int:
+        return monotonic_ns()
+
+
+@dataclass
+class SimulatedClock(Clock):
+    now: float = 0.0
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def monotonic_ns(self) -> int:
+        return round(self.now * 1_000_000_000)
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
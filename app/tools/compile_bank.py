@@ -0,0 +1,101 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+from array import array
+from os.path import join
+
+from repository import BANK_HEADER, BANK_MAGIC, BANK_VERSION, QuestionIndex, align
+from tools.load_default import BANK_FILE, FileReport, iter_questions, summary
+
+
+def pad(file, size: int) -> None:
+    file.write(b"\0" * (align(size) - size))
+
+
+def compile_bank(
+    source: str, target: str, reports: list[FileReport] | None = None
+) -> int:
+    offsets = array("Q", [0])
+    index = QuestionIndex()
+    reports = [] if reports is None else reports
+    with tempfile.TemporaryFile() as records:
+        for q in iter_questions(source, reports):
+            categories = q.get("categories", [])
+            difficulty = q.get("difficulty")
+            language = q.get("language")
+            record = json.dumps(
+                [
+                    q["statement"],
+                    q["answer"],
+                    q["options"],
+                    categories,
+                    difficulty,
+                    language,
+                ],
+                ensure_ascii=False,
+                separators=(",", ":"),
+            ).encode()
+            records.write(record)
+            offsets.append(offsets[-1] + len(record))
+            index.add(categories, difficulty, language)
+
+        total = len(offsets) - 1
+        partial = f"{target}.tmp"
+        with open(partial, "wb") as bank:
+            bank.write(BANK_HEADER.pack(BANK_MAGIC, BANK_VERSION, total, 0, 0, 0))
+            bank.write(offsets.tobytes())
+            records.seek(0)
+            shutil.copyfileobj(records, bank)
+            pad(bank, bank.tell())
+
+            meta = bank.tell()
+            bank.write(bytes(index.difficulty))
+            pad(bank, total)
+            bank.write(index.language.tobytes())
+            pad(bank, total * 2)
+
+            layout = {"languages": index.languages, "postings": {}}
+            offset = 0
+            for term, posting in index.postings.items():
+                bank.write(posting.tobytes())
+                layout["postings"][term] = [offset, len(posting)]
+                offset += len(posting)
+
+            directory = bank.tell()
+            encoded = json.dumps(layout, ensure_ascii=False).encode()
+            bank.write(encoded)
+            bank.seek(0)
+            bank.write(
+                BANK_HEADER.pack(
+                    BANK_MAGIC, BANK_VERSION, total, meta, directory, len(encoded)
+                )
+            )
+        os.replace(partial, target)
+
+    return total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compile JSON questions into a bank")
+    parser.add_argument("source", nargs="?", default="data")
+    parser.add_argument("--output", help=f"Default {BANK_FILE} inside the source")
+    args = parser.parse_args()
+
+    target = args.output or join(args.source, BANK_FILE)
+    reports: list[FileReport] = []
+    total = compile_bank(args.source, target, reports)
+    for report in reports:
+        print(
+            f"{report.file}: loaded={report.loaded} duplicated={report.duplicated} "
+            f"rejected={len(report.rejected)} {report.seconds:.2f}s"
+        )
+        for position, error in report.rejected[:10]:
+            print(f"  entry {position}: {error}")
+    print(summary(reports))
+    print(f"questions={total} bank={target} size={os.path.getsize(target)}")
+
+
+if __name__ == "__main__":
+    main()
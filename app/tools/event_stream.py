@@ -1,31 +1,416 @@
+import asyncio
 from abc import ABC, abstractmethod
-from collections.abc import Generator
+from collections import Counter, OrderedDict, defaultdict, deque
+from collections.abc import AsyncGenerator, Callable, Generator, Iterable
 from dataclasses import dataclass, field
-from queue import Queue
+from itertools import count
+from random import getrandbits
+from threading import Condition, Lock
+from time import monotonic, perf_counter
 
 from flask import Flask, render_template, render_template_string
 from jinja2 import BaseLoader, Environment, Template
+from tools.metrics import REGISTRY, SIZE_BUCKETS
+
+HEARTBEAT = b": keep-alive\n\n"
+
+RENDER_SECONDS = REGISTRY.histogram(
+    "quizz_render_seconds", "Time spent rendering an event template", ("event",)
+)
+FANOUT_SECONDS = REGISTRY.histogram(
+    "quizz_fanout_seconds", "Time spent queueing a broadcast", ("channel",)
+)
+FANOUT_SUBSCRIBERS = REGISTRY.histogram(
+    "quizz_fanout_subscribers",
+    "Subscribers reached by a broadcast",
+    ("channel",),
+    SIZE_BUCKETS,
+)
+STREAM_DELAY = REGISTRY.histogram(
+    "quizz_stream_delay_seconds", "Time a message waited in a subscriber queue"
+).labels()
+
+
+@dataclass(eq=False)
+class Subscriber:
+    channels: frozenset[str]
+    key: str | None = None
+    player: int | None = None
+    slot: int = field(default_factory=lambda: getrandbits(16))
+
+    _messages: deque[tuple[str | None, bytes, float]] = field(
+        default_factory=deque, init=False
+    )
+    _condition: Condition = field(default_factory=Condition, init=False)
+    _closed: bool = field(default=False, init=False)
+
+    def put(
+        self, message: bytes, channel: str | None = None, latest: bool = False
+    ) -> bool:
+        at = monotonic()
+        replaced = False
+        with self._condition:
+            if latest:
+                for index, (pending, _, since) in enumerate(self._messages):
+                    if pending == channel:
+                        del self._messages[index]
+                        at, replaced = since, True
+                        break
+            self._messages.append((channel, message, at))
+            self._condition.notify()
+        return replaced
+
+    def stalled(self, limit: int, stall: float) -> bool:
+        with self._condition:
+            if not self._messages:
+                return False
+            return (
+                len(self._messages) > limit
+                or monotonic() - self._messages[0][2] > stall
+            )
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+    def drop(self) -> int:
+        with self._condition:
+            dropped = len(self._messages)
+            self._messages.clear()
+        self.close()
+        return dropped
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def pending(self) -> int:
+        return len(self._messages)
+
+    def drain(self, timeout: float | None = None) -> tuple[list[bytes], bool]:
+        with self._condition:
+            if timeout and not self._messages and not self._closed:
+                self._condition.wait(timeout)
+            if self._messages:
+                since = min(at for _, _, at in self._messages)
+                STREAM_DELAY.observe(monotonic() - since)
+            messages = [message for _, message, _ in self._messages]
+            self._messages.clear()
+            return messages, self._closed
+
+    def stream(self, heartbeat: float) -> Generator[bytes]:
+        while True:
+            messages, closed = self.drain(heartbeat)
+
+            if messages:
+                yield from messages
+            elif closed:
+                return
+            else:
+                yield HEARTBEAT
+
+
+@dataclass(eq=False)
+class AsyncSubscriber(Subscriber):
+    loop: asyncio.AbstractEventLoop | None = None
+
+    _wakeup: asyncio.Event = field(default_factory=asyncio.Event, init=False)
+
+    def put(
+        self, message: bytes, channel: str | None = None, latest: bool = False
+    ) -> bool:
+        replaced = super().put(message, channel, latest)
+        self.__wake()
+        return replaced
+
+    def close(self) -> None:
+        super().close()
+        self.__wake()
+
+    def __wake(self) -> None:
+        try:
+            self.loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:
+            pass
+
+    async def astream(self, heartbeat: float) -> AsyncGenerator[bytes]:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), heartbeat)
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+            messages, closed = self.drain()
+
+            if messages:
+                for message in messages:
+                    yield message
+            elif closed:
+                return
+            else:
+                yield HEARTBEAT
+
+
+@dataclass
+class EventHub:
+    heartbeat: float = 15.0
+    relay: Callable[[str, tuple[bytes, ...]], None] | None = None
+    replay: int = 64
+    coalesce: frozenset[str] = frozenset({"graphic", "score"})
+    limit: int = 256
+    stall: float = 60.0
+
+    _channels: dict[str, set[Subscriber]] = field(
+        default_factory=lambda: defaultdict(set), init=False
+    )
+    _keys: dict[str, Subscriber] = field(default_factory=dict, init=False)
+    _subscribers: set[Subscriber] = field(default_factory=set, init=False)
+    _personal: dict[str, Callable[[Subscriber], bytes | None]] = field(
+        default_factory=dict, init=False
+    )
+    _history: deque[tuple[int, str, tuple[bytes, ...]]] = field(init=False)
+    _ids: count = field(default_factory=lambda: count(1), init=False)
+    _metrics: Counter[str] = field(default_factory=Counter, init=False)
+    _lock: Lock = field(default_factory=Lock, init=False)
+
+    def __post_init__(self):
+        self._history = deque(maxlen=self.replay)
+
+    def subscribe(
+        self,
+        *channels: str,
+        key: str | None = None,
+        player: int | None = None,
+        last_event_id: int | None = None,
+    ) -> Subscriber:
+        return self.attach(
+            Subscriber(channels=frozenset(channels), key=key, player=player),
+            last_event_id,
+        )
+
+    def attach(
+        self, subscriber: Subscriber, last_event_id: int | None = None
+    ) -> Subscriber:
+        key = subscriber.key
+        with self._lock:
+            previous = self._keys.pop(key, None) if key is not None else None
+            if previous is not None:
+                self.__remove(previous)
+            if key is not None:
+                self._keys[key] = subscriber
+            for channel, messages in self.__missed(subscriber.channels, last_event_id):
+                subscriber.put(
+                    messages[subscriber.slot % len(messages)],
+                    channel,
+                    channel in self.coalesce,
+                )
+            self._subscribers.add(subscriber)
+            for channel in subscriber.channels:
+                self._channels[channel].add(subscriber)
+
+        if previous is not None:
+            previous.close()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self.__detach(subscriber)
+        subscriber.close()
+
+    def __detach(self, subscriber: Subscriber) -> None:
+        with self._lock:
+            if self._keys.get(subscriber.key) is subscriber:
+                del self._keys[subscriber.key]
+            self.__remove(subscriber)
+
+    def __remove(self, subscriber: Subscriber) -> None:
+        self._subscribers.discard(subscriber)
+        for channel in subscriber.channels:
+            self._channels[channel].discard(subscriber)
+
+    def __missed(
+        self, channels: frozenset[str], last_event_id: int | None
+    ) -> list[tuple[str, tuple[bytes, ...]]]:
+        history = [entry for entry in self._history if entry[1] in channels]
+        if (
+            last_event_id is not None
+            and self._history
+            and self._history[0][0] <= last_event_id + 1
+            and last_event_id <= self._history[-1][0]
+        ):
+            return [
+                (channel, messages)
+                for id, channel, messages in history
+                if id > last_event_id
+            ]
+
+        latest = {channel: (id, messages) for id, channel, messages in history}
+        return [
+            (channel, messages)
+            for channel, (_, messages) in sorted(
+                latest.items(), key=lambda item: item[1][0]
+            )
+        ]
+
+    def forget(self) -> None:
+        with self._lock:
+            self._history.clear()
+
+    def listen(
+        self,
+        *channels: str,
+        key: str | None = None,
+        player: int | None = None,
+        last_event_id: int | None = None,
+    ) -> Generator[bytes]:
+        subscriber = self.subscribe(
+            *channels, key=key, player=player, last_event_id=last_event_id
+        )
+        try:
+            yield from subscriber.stream(self.heartbeat)
+        finally:
+            self.unsubscribe(subscriber)
+
+    async def alisten(
+        self,
+        *channels: str,
+        key: str | None = None,
+        player: int | None = None,
+        last_event_id: int | None = None,
+    ) -> AsyncGenerator[bytes]:
+        subscriber = self.attach(
+            AsyncSubscriber(
+                channels=frozenset(channels),
+                key=key,
+                player=player,
+                loop=asyncio.get_running_loop(),
+            ),
+            last_event_id,
+        )
+        try:
+            async for message in subscriber.astream(self.heartbeat):
+                yield message
+        finally:
+            self.unsubscribe(subscriber)
+
+    def personalize(
+        self, channel: str, personal: Callable[[Subscriber], bytes | None]
+    ) -> None:
+        self._personal[channel] = personal
+
+    def publish(self, channel: str, messages: tuple[bytes, ...]) -> None:
+        if self.relay is not None:
+            self.relay(channel, messages)
+        else:
+            self.deliver(channel, messages)
+
+    def deliver(
+        self, channel: str, messages: tuple[bytes, ...], id: int | None = None
+    ) -> None:
+        if id is None:
+            id = next(self._ids)
+        prefix = b"id: %d\n" % id
+        messages = tuple(prefix + message for message in messages)
+
+        with self._lock:
+            self._history.append((id, channel, messages))
+            subscribers = tuple(self._channels[channel])
+
+        start = perf_counter()
+        personal = self._personal.get(channel)
+        latest = channel in self.coalesce
+        coalesced = 0
+        stalled = []
+        for subscriber in subscribers:
+            message = messages[subscriber.slot % len(messages)]
+            if personal is not None:
+                message += personal(subscriber) or b""
+            coalesced += subscriber.put(message, channel, latest)
+            if subscriber.stalled(self.limit, self.stall):
+                stalled.append(subscriber)
+
+        dropped = 0
+        for subscriber in stalled:
+            self.__detach(subscriber)
+            dropped += subscriber.drop()
+        FANOUT_SECONDS.labels(channel).observe(perf_counter() - start)
+        FANOUT_SUBSCRIBERS.labels(channel).observe(len(subscribers))
+
+        with self._lock:
+            self._metrics["delivered"] += len(subscribers)
+            self._metrics["coalesced"] += coalesced
+            self._metrics["dropped"] += dropped
+            self._metrics["disconnected"] += len(stalled)
+
+    def count(self, channel: str) -> int:
+        with self._lock:
+            return len(self._channels[channel])
+
+    @property
+    def active(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    @property
+    def metrics(self) -> dict[str, int]:
+        with self._lock:
+            subscribers = tuple(self._subscribers)
+            metrics = dict(self._metrics)
+        metrics["pending"] = sum(subscriber.pending for subscriber in subscribers)
+        return metrics
+
+    def init_app(self, app: Flask) -> None:
+        app.extensions["event_hub"] = self
 
 
 @dataclass
 class EventStreamABC(ABC):
     event: str
     template: str
+    hub: EventHub
+    channel: str
+    variants: Callable[..., Iterable[dict]] | None = field(default=None, kw_only=True)
+    personal: Callable[[Subscriber], bytes | None] | None = field(
+        default=None, kw_only=True
+    )
+
+    _cache: OrderedDict[tuple, tuple[bytes, ...]] = field(
+        default_factory=OrderedDict, init=False
+    )
+    _cache_lock: Lock = field(default_factory=Lock, init=False)
 
-    __queue: Queue | None = field(default=None, init=False)
+    CACHE_SIZE = 8
 
     def __post_init__(self):
-        if self.__queue is None:
-            self.__queue = Queue()
+        if self.personal is not None:
+            self.hub.personalize(self.channel, self.personal)
+
+    def action_stream(self, version: int | None = None, **kwargs) -> None:
+        self.hub.publish(self.channel, self.encode(version, **kwargs))
 
-    def stream(self) -> Generator[str, None]:
-        while not self.__queue.empty():
-            message = self.__queue.get_nowait()
-            yield message
+    def encode(self, version: int | None = None, **kwargs) -> tuple[bytes, ...]:
+        key = (self.template, version)
+        if version is not None:
+            with self._cache_lock:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    return self._cache[key]
 
-    def action_stream(self, **kwargs) -> str:
-        message = f"event: {self.event}\ndata: {self.render_template(**kwargs)}\n\n"
-        self.__queue.put(message)
+        contexts = self.variants(**kwargs) if self.variants else (kwargs,)
+        messages = tuple(self.message(**context) for context in contexts)
+
+        if version is not None:
+            with self._cache_lock:
+                self._cache[key] = messages
+                while len(self._cache) > self.CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        return messages
+
+    def message(self, **kwargs) -> bytes:
+        with RENDER_SECONDS.labels(self.event).time():
+            data = self.render_template(**kwargs)
+        return f"event: {self.event}\ndata: {data}\n\n".encode()
 
     @abstractmethod
     def render_template(self, **kwargs) -> str: ...
@@ -39,7 +424,6 @@ class EventStream(EventStreamABC):
 
     def __post_init__(self):
         super().__post_init__()
-
         self._template = Environment(loader=BaseLoader(), autoescape=True).from_string(
             self.template
         )
@@ -0,0 +1,122 @@
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+from time import monotonic, sleep
+
+from config.app import create_app
+from model import Answer, Player
+from rooms import RoomRegistry
+from services import StatusQuestionEnum
+
+OPTIONS = ["a", "b", "c", "d"]
+
+
+def worker(state: str) -> RoomRegistry:
+    os.environ["FAST_PUNCH_STATE"] = state
+    os.environ["FAST_PUNCH_RELOAD"] = "0"
+    return create_app().extensions["rooms"]
+
+
+def lead(state: str, players: int) -> None:
+    rooms = worker(state)
+    rooms.bank.add_questions(
+        {"statement": f"Question {i}", "answer": "a", "options": OPTIONS.copy()}
+        for i in range(10)
+    )
+    room = rooms.default
+    room.configure(total=3, qtime=60, stime=1, ptime=1)
+    room.start()
+    for id in range(players):
+        room.register(Player(nickname=f"player-{id}"))
+    room.service.advance()
+    while room.status != StatusQuestionEnum.QUESTION:
+        sleep(0.01)
+
+    question = room.service.get_question()
+    for id in range(players // 2):
+        key = Player(nickname=f"player-{id}").__hash__()
+        room.evaluate(key, Answer(question_id=question.id, option="a"), None)
+    sleep(rooms.backend.interval * 2)
+    print(question.id, flush=True)
+    sleep(3600)
+
+
+def run(players: int) -> dict:
+    fd, path = tempfile.mkstemp(prefix="fast-punch-", suffix=".db")
+    os.close(fd)
+    state = f"sqlite://{path}"
+    leader = subprocess.Popen(
+        [sys.executable, "-m", "tools.failover", "--lead", state],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        question_id = leader.stdout.readline().strip()
+        rooms = worker(state)
+        room = rooms.get("MAIN")
+        lease = rooms.backend.lease
+        os.kill(leader.pid, signal.SIGKILL)
+        leader.wait()
+        killed = monotonic()
+
+        while not room.leader and monotonic() - killed < lease + 5:
+            sleep(0.05)
+        took_over = monotonic() - killed
+        deadline = monotonic() + lease
+        while (
+            room.status != StatusQuestionEnum.QUESTION
+            and room.leader
+            and monotonic() < deadline
+        ):
+            sleep(0.01)
+        sleep(rooms.backend.interval * 4)
+
+        service = room.service
+        question = service.get_question()
+        first = Player(nickname="player-0").__hash__()
+        last = Player(nickname=f"player-{players - 1}").__hash__()
+        answer = Answer(question_id=question_id, option="a")
+        return {
+            "took_over": room.leader,
+            "seconds": took_over,
+            "same_question": question is not None and question.id == question_id,
+            "players_ok": service.players.total == players,
+            "answers_ok": question is not None
+            and question.answers["a"] == players // 2,
+            "reanswer_rejected": service.evaluate(first, answer) is None,
+            "new_answer_accepted": service.evaluate(last, answer) is not None,
+            "question_resent": any(
+                channel == "question" for _, channel, _ in room.hub._history
+            ),
+        }
+    finally:
+        if leader.poll() is None:
+            leader.kill()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Kill a room leader mid-question")
+    parser.add_argument("--players", type=int, default=20)
+    parser.add_argument("--lead", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.lead:
+        lead(args.lead, args.players)
+        return
+
+    result = run(args.players)
+    for name, value in result.items():
+        print(f"{name:>20}: {value}")
+
+    if not all(value for name, value in result.items() if name != "seconds"):
+        raise SystemExit("the follower did not continue the game")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from time import monotonic_ns
+
+from flask import request
+
+RECEIVED_AT = "fast_punch.received_ns"
+
+
+@dataclass
+class IngressStamp:
+    app: Callable
+
+    def __call__(self, environ: dict, start_response: Callable) -> Iterable[bytes]:
+        scope = environ.get("asgi.scope") or {}
+        environ.setdefault(RECEIVED_AT, scope.get(RECEIVED_AT) or monotonic_ns())
+        return self.app(environ, start_response)
+
+
+def received_ns() -> int:
+    return request.environ.get(RECEIVED_AT) or monotonic_ns()
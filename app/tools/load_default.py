@@ -1,17 +1,229 @@
 import json
+import logging
+import multiprocessing
+import os
+import pickle
+import tempfile
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from hashlib import blake2b
+from itertools import batched
 from os import listdir
-from os.path import isfile, join
+from os.path import getsize, isfile, join
+from time import perf_counter
+from typing import TextIO
 
 from repository import QuizzRepository
 
+BANK_FILE = "bank.fpq"
+QUESTION_FILES = (".json", ".jsonl")
+QUESTION_FIELDS = {
+    "statement",
+    "answer",
+    "options",
+    "categories",
+    "difficulty",
+    "language",
+}
+CHUNK_SIZE = 1 << 16
+MAX_ENTRY = 1 << 20
+PARALLEL_BYTES = 8 << 20
+SPILL_BATCH = 1024
 
-def load_files(repository: QuizzRepository, app_path: str) -> None:
-    files = [
-        f
+logger = logging.getLogger("quizz.questions")
+
+
+@dataclass
+class FileReport:
+    file: str
+    loaded: int = 0
+    duplicated: int = 0
+    rejected: list[tuple[int, str]] = field(default_factory=list)
+    seconds: float = 0.0
+
+
+def iter_values(f: TextIO) -> Iterator[tuple[int, object, str | None]]:
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    position = 0
+    eof = False
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,[]":
+            pos += 1
+        if pos >= len(buffer):
+            if eof:
+                return
+            buffer, pos = f.read(CHUNK_SIZE), 0
+            eof = not buffer
+            continue
+
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as error:
+            if not eof and len(buffer) - pos < MAX_ENTRY:
+                chunk = f.read(CHUNK_SIZE)
+                eof = not chunk
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+
+            position += 1
+            yield position, None, f"invalid JSON: {error.msg}"
+            following = buffer.find("{", pos + 1)
+            pos = following if following != -1 else len(buffer)
+            continue
+
+        position += 1
+        yield position, value, None
+        pos = end
+        if pos > CHUNK_SIZE:
+            buffer, pos = buffer[pos:], 0
+
+
+def validate(entry: object) -> str | None:
+    if not isinstance(entry, dict):
+        return "not an object"
+    unknown = entry.keys() - QUESTION_FIELDS
+    if unknown:
+        return f"unknown fields: {', '.join(sorted(unknown))}"
+
+    statement = entry.get("statement")
+    options = entry.get("options")
+    if not isinstance(statement, str) or not statement.strip():
+        return "missing statement"
+    if type(options) is not list or len(options) < 2:
+        return "options must list at least two answers"
+    if any(type(option) is not str for option in options):
+        return "options must be strings"
+    if entry.get("answer") not in options:
+        return "answer not in options"
+
+    categories = entry.get("categories", [])
+    if not isinstance(categories, list) or not all(
+        isinstance(category, str) for category in categories
+    ):
+        return "categories must be a list of strings"
+    difficulty = entry.get("difficulty")
+    if difficulty is not None and (
+        not isinstance(difficulty, int)
+        or isinstance(difficulty, bool)
+        or difficulty < 0
+    ):
+        return "difficulty must be a non negative integer"
+    if entry.get("language") is not None and not isinstance(entry["language"], str):
+        return "language must be a string"
+    return None
+
+
+def statement_key(entry: dict) -> bytes:
+    statement = " ".join(entry["statement"].casefold().split())
+    return blake2b(statement.encode(), digest_size=16).digest()
+
+
+def scan_file(path: str, report: FileReport) -> Iterator[tuple[bytes, dict]]:
+    start = perf_counter()
+    with open(path, "r", encoding="utf-8") as f:
+        for position, entry, error in iter_values(f):
+            error = error or validate(entry)
+            if error is None:
+                yield statement_key(entry), entry
+            else:
+                report.rejected.append((position, error))
+    report.seconds = perf_counter() - start
+
+
+def spill_file(path: str, directory: str) -> tuple[str, FileReport]:
+    report = FileReport(file=path)
+    fd, spill = tempfile.mkstemp(suffix=".spill", dir=directory)
+    with os.fdopen(fd, "wb") as f:
+        for batch in batched(scan_file(path, report), SPILL_BATCH):
+            pickle.dump(batch, f, pickle.HIGHEST_PROTOCOL)
+    return spill, report
+
+
+def read_spill(spill: str) -> Iterator[tuple[bytes, dict]]:
+    with open(spill, "rb") as f:
+        while True:
+            try:
+                batch = pickle.load(f)
+            except EOFError:
+                break
+            yield from batch
+    os.remove(spill)
+
+
+def question_files(app_path: str) -> list[str]:
+    return sorted(
+        join(app_path, f)
         for f in listdir(app_path)
-        if isfile(join(app_path, f)) and f.endswith(".json")
-    ]
-    for file in files:
-        with open(join(app_path, file), "r", encoding="utf-8") as f:
-            qs = f.read()
-            repository.add_questions(json.loads(qs))
+        if isfile(join(app_path, f)) and f.endswith(QUESTION_FILES)
+    )
+
+
+def read_files(
+    files: list[str], workers: int | None = None
+) -> Iterator[tuple[Iterable[tuple[bytes, dict]], FileReport]]:
+    workers = min(workers or os.process_cpu_count() or 1, len(files))
+    if workers < 2 or sum(map(getsize, files)) < PARALLEL_BYTES:
+        for path in files:
+            report = FileReport(file=path)
+            yield scan_file(path, report), report
+        return
+
+    context = multiprocessing.get_context("spawn")
+    with (
+        tempfile.TemporaryDirectory(prefix="fast-punch-") as directory,
+        ProcessPoolExecutor(workers, mp_context=context) as executor,
+    ):
+        spill = partial(spill_file, directory=directory)
+        for path, report in executor.map(spill, files):
+            yield read_spill(path), report
+
+
+def iter_questions(
+    app_path: str, reports: list[FileReport], workers: int | None = None
+) -> Iterator[dict]:
+    seen: set[bytes] = set()
+    for entries, report in read_files(question_files(app_path), workers):
+        for key, entry in entries:
+            if key in seen:
+                report.duplicated += 1
+                continue
+            seen.add(key)
+            report.loaded += 1
+            yield entry
+        reports.append(report)
+        log_report(report)
+
+
+def log_report(report: FileReport) -> None:
+    logger.info(
+        "%s: loaded=%d duplicated=%d rejected=%d in %.3fs",
+        report.file,
+        report.loaded,
+        report.duplicated,
+        len(report.rejected),
+        report.seconds,
+    )
+    for position, error in report.rejected[:10]:
+        logger.warning("%s: entry %d rejected, %s", report.file, position, error)
+
+
+def load_files(
+    repository: QuizzRepository, app_path: str, workers: int | None = None
+) -> list[FileReport]:
+    reports: list[FileReport] = []
+    repository.add_questions(iter_questions(app_path, reports, workers))
+    return reports
+
+
+def summary(reports: Iterable[FileReport]) -> str:
+    reports = list(reports)
+    return (
+        f"files={len(reports)} loaded={sum(r.loaded for r in reports)} "
+        f"duplicated={sum(r.duplicated for r in reports)} "
+        f"rejected={sum(len(r.rejected) for r in reports)}"
+    )
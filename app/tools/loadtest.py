@@ -0,0 +1,264 @@
+import argparse
+import html
+import logging
+import os
+import re
+import resource
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+from http.cookiejar import CookieJar
+from random import choice, lognormvariate, uniform
+from statistics import quantiles
+from time import monotonic, sleep
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, build_opener
+
+QUESTION_ID = re.compile(r'"question_id": "([0-9a-f]+)"')
+OPTION = re.compile(r'"option": "(.*?)", "question_id"')
+JOIN_ATTEMPTS = 10
+
+
+class NoRedirect(HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+@dataclass
+class Stats:
+    latencies: dict[str, list[float]] = field(default_factory=lambda: defaultdict(list))
+    received: dict[int, list[float]] = field(default_factory=lambda: defaultdict(list))
+    published: list[float] = field(default_factory=list)
+    errors: dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def latency(self, endpoint: str, seconds: float) -> None:
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+
+    def receipt(self, sequence: int, at: float) -> None:
+        with self._lock:
+            self.received[sequence].append(at)
+
+    def error(self, endpoint: str) -> None:
+        with self._lock:
+            self.errors[endpoint] += 1
+
+    def fanout(self) -> list[float]:
+        delays = []
+        for sequence, stamps in self.received.items():
+            if sequence < len(self.published):
+                reference = self.published[sequence]
+            else:
+                reference = min(stamps)
+            delays.extend(at - reference for at in stamps)
+        return delays
+
+
+@dataclass
+class Player:
+    base: str
+    nickname: str
+    stats: Stats
+    think: float
+    room: str | None = None
+
+    done: threading.Event = field(default_factory=threading.Event)
+
+    def __post_init__(self):
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()), NoRedirect())
+
+    def request(self, endpoint: str, data: dict | None = None) -> bytes | None:
+        body = urlencode(data).encode() if data is not None else None
+        start = monotonic()
+        try:
+            with self.opener.open(self.base + endpoint, data=body, timeout=30) as r:
+                content = r.read()
+        except HTTPError as error:
+            if error.code >= 400:
+                self.stats.error(endpoint)
+                return None
+            content = b""
+        except OSError:
+            self.stats.error(endpoint)
+            return None
+        name = "/r/<code>" if endpoint.startswith("/r/") else endpoint
+        self.stats.latency(name, monotonic() - start)
+        return content
+
+    def join(self) -> None:
+        if self.room:
+            self.request(f"/r/{self.room}")
+        for _ in range(JOIN_ATTEMPTS):
+            if (
+                self.request("/join", {"nickname": self.nickname, "avatar": ""})
+                is not None
+            ):
+                return
+            sleep(uniform(1, 2))
+
+    def listen(self) -> None:
+        sequence = 0
+        event = None
+        try:
+            with self.opener.open(self.base + "/events", timeout=120) as stream:
+                for raw in stream:
+                    line = raw.decode("utf-8").rstrip("\n")
+                    if line.startswith("event: "):
+                        event = line[7:]
+                    elif line.startswith("data: ") and event == "question":
+                        self.stats.receipt(sequence, monotonic())
+                        sequence += 1
+                        self.answer(line)
+                    elif line.startswith("data: ") and event == "end-game":
+                        break
+        except OSError:
+            self.stats.error("/events")
+        finally:
+            self.done.set()
+
+    def answer(self, data: str) -> None:
+        question = QUESTION_ID.search(data)
+        options = OPTION.findall(data)
+        if question is None or not options:
+            return
+
+        payload = {
+            "option": html.unescape(choice(options)),
+            "question_id": question.group(1),
+        }
+        delay = lognormvariate(0, 0.5) * self.think
+        threading.Timer(delay, self.request, ("/answer", payload)).start()
+
+
+def percentiles(values: list[float]) -> str:
+    if len(values) < 2:
+        return "n/a"
+    q = quantiles(values, n=100)
+    return (
+        f"p50={q[49] * 1000:8.1f}ms p95={q[94] * 1000:8.1f}ms p99={q[98] * 1000:8.1f}ms"
+    )
+
+
+def process_usage(pid: int) -> tuple[float, int]:
+    if pid == os.getpid():
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime, usage.ru_maxrss * 1024
+
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    with open(f"/proc/{pid}/status") as f:
+        rss = next(
+            int(line.split()[1]) * 1024 for line in f if line.startswith("VmRSS")
+        )
+    return cpu, rss
+
+
+def start_server(stats: Stats) -> str:
+    from config.app import create_app
+    from werkzeug.serving import make_server
+
+    app = create_app()
+    bank = app.extensions["rooms"].bank
+    if bank.total == 0:
+        bank.add_questions(
+            {
+                "statement": f"Question {i}",
+                "answer": "a",
+                "options": ["a", "b", "c", "d"],
+            }
+            for i in range(100)
+        )
+
+    def stamp(room) -> None:
+        publish = room.hub.publish
+
+        def stamped(channel, *args, **kwargs):
+            if channel in ("question", "score"):
+                stats.published.append(monotonic())
+            return publish(channel, *args, **kwargs)
+
+        room.hub.publish = stamped
+
+    app.extensions["rooms"].on_create(stamp)
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Simulate players end-to-end")
+    parser.add_argument("--url", help="Target server, default starts one in-process")
+    parser.add_argument("--pid", type=int, help="Server pid for CPU and RSS")
+    parser.add_argument("--players", type=int, default=50)
+    parser.add_argument("--questions", type=int, default=3)
+    parser.add_argument("--question-time", type=int, default=5)
+    parser.add_argument("--score-time", type=int, default=1)
+    parser.add_argument("--players-time", type=int, default=5)
+    parser.add_argument("--think", type=float, default=1.0)
+    parser.add_argument("--room", action="store_true", help="Play in a new room")
+    args = parser.parse_args()
+
+    stats = Stats()
+    base = args.url.rstrip("/") if args.url else start_server(stats)
+    pid = args.pid or (None if args.url else os.getpid())
+    usage = process_usage(pid) if pid else None
+
+    admin = Player(base=base, nickname="admin", stats=Stats(), think=0)
+    room = None
+    if args.room:
+        created = re.search(rb'"code":\s*"(\w+)"', admin.request("/admin/rooms", {}))
+        room = created.group(1).decode()
+        admin.request(f"/r/{room}")
+    admin.request(
+        "/admin/config",
+        {
+            "total": args.questions,
+            "qtime": args.question_time,
+            "stime": args.score_time,
+            "ptime": args.players_time,
+        },
+    )
+
+    players = [
+        Player(
+            base=base, nickname=f"load-{i}", stats=stats, think=args.think, room=room
+        )
+        for i in range(args.players)
+    ]
+    started = monotonic()
+    joins = [threading.Thread(target=p.join) for p in players]
+    for thread in joins:
+        thread.start()
+    for thread in joins:
+        thread.join()
+    for player in players:
+        threading.Thread(target=player.listen, daemon=True).start()
+
+    timeout = args.players_time + args.questions * (
+        args.question_time + args.score_time + 5
+    )
+    for player in players:
+        player.done.wait(max(0.0, started + timeout - monotonic()))
+    elapsed = monotonic() - started
+    sleep(args.think * 3)
+
+    print(f"players={args.players} elapsed={elapsed:.1f}s")
+    for endpoint, values in sorted(stats.latencies.items()):
+        print(f"{endpoint:>12} n={len(values):6d} {percentiles(values)}")
+    print(
+        f"{'sse fan-out':>12} n={len(stats.fanout()):6d} {percentiles(stats.fanout())}"
+    )
+    for endpoint, total in sorted(stats.errors.items()):
+        print(f"{endpoint:>12} errors={total}")
+    if usage:
+        cpu, rss = process_usage(pid)
+        print(f"{'cpu':>12} {cpu - usage[0]:.2f}s  rss={rss / 2**20:.1f}MiB")
+
+
+if __name__ == "__main__":
+    main()
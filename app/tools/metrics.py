@@ -0,0 +1,227 @@
+from bisect import bisect_left
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from itertools import accumulate
+from threading import Lock
+from time import monotonic_ns, perf_counter
+
+from flask import Flask, Response, request
+from tools.ingress import received_ns
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+SIZE_BUCKETS = (0, 1, 10, 100, 1000, 10_000, 100_000)
+
+
+@dataclass(eq=False)
+class Counter:
+    _value: float = field(default=0, init=False)
+    _lock: Lock = field(default_factory=Lock, init=False)
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    def samples(self, name: str, labels: str) -> Iterator[str]:
+        yield f"{series(name, labels)} {self._value}"
+
+
+@dataclass(eq=False)
+class Gauge:
+    _value: float = field(default=0, init=False)
+    _lock: Lock = field(default_factory=Lock, init=False)
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.inc(-amount)
+
+    def samples(self, name: str, labels: str) -> Iterator[str]:
+        yield f"{series(name, labels)} {self._value}"
+
+
+@dataclass(eq=False)
+class Histogram:
+    buckets: tuple[float, ...] = LATENCY_BUCKETS
+
+    _counts: list[int] = field(default_factory=list, init=False)
+    _sum: float = field(default=0, init=False)
+    _lock: Lock = field(default_factory=Lock, init=False)
+
+    def __post_init__(self):
+        self._counts = [0] * (len(self.buckets) + 1)
+
+    def observe(self, value: float) -> None:
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[bucket] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start)
+
+    def samples(self, name: str, labels: str) -> Iterator[str]:
+        with self._lock:
+            counts, total = self._counts.copy(), self._sum
+        separator = "," if labels else ""
+        bounds = (*map(str, self.buckets), "+Inf")
+        for bound, count in zip(bounds, accumulate(counts)):
+            yield f'{name}_bucket{{{labels}{separator}le="{bound}"}} {count}'
+        yield f"{series(name + '_sum', labels)} {total}"
+        yield f"{series(name + '_count', labels)} {sum(counts)}"
+
+
+Metric = Counter | Gauge | Histogram
+
+
+@dataclass(eq=False)
+class Family:
+    name: str
+    help: str
+    kind: str
+    factory: Callable[[], Metric]
+    labelnames: tuple[str, ...] = ()
+    collect: Callable[[], Iterable[tuple[tuple[str, ...], float]]] | None = None
+
+    _children: dict[tuple[str, ...], Metric] = field(default_factory=dict, init=False)
+    _lock: Lock = field(default_factory=Lock, init=False)
+
+    def labels(self, *values: str) -> Metric:
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self.factory())
+        return child
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        if self.collect is not None:
+            for values, value in self.collect():
+                yield f"{series(self.name, self.__labels(values))} {value}"
+            return
+
+        for values, child in sorted(self._children.items()):
+            yield from child.samples(self.name, self.__labels(values))
+
+    def __labels(self, values: tuple[str, ...]) -> str:
+        return ",".join(
+            f'{name}="{escape(value)}"' for name, value in zip(self.labelnames, values)
+        )
+
+
+def series(name: str, labels: str) -> str:
+    return f"{name}{{{labels}}}" if labels else name
+
+
+def escape(value: str) -> str:
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+@dataclass
+class MetricsRegistry:
+    _families: dict[str, Family] = field(default_factory=dict, init=False)
+    _lock: Lock = field(default_factory=Lock, init=False)
+
+    def counter(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        collect: Callable[[], Iterable[tuple[tuple[str, ...], float]]] | None = None,
+    ) -> Family:
+        return self.__register(name, help, "counter", Counter, labels, collect)
+
+    def gauge(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        collect: Callable[[], Iterable[tuple[tuple[str, ...], float]]] | None = None,
+    ) -> Family:
+        return self.__register(name, help, "gauge", Gauge, labels, collect)
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> Family:
+        return self.__register(
+            name, help, "histogram", lambda: Histogram(buckets), labels, None
+        )
+
+    def __register(
+        self,
+        name: str,
+        help: str,
+        kind: str,
+        factory: Callable[[], Metric],
+        labels: tuple[str, ...],
+        collect: Callable[[], Iterable[tuple[tuple[str, ...], float]]] | None,
+    ) -> Family:
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = Family(
+                    name=name, help=help, kind=kind, factory=factory, labelnames=labels
+                )
+            if collect is not None:
+                family.collect = collect
+            return family
+
+    def render(self) -> str:
+        with self._lock:
+            families = tuple(self._families.values())
+        return "".join(f"{line}\n" for family in families for line in family.render())
+
+    def init_app(self, app: Flask) -> None:
+        app.extensions["metrics"] = self
+        requests = self.counter(
+            "quizz_http_requests_total",
+            "Handled HTTP requests",
+            ("method", "route", "code"),
+        )
+        latency = self.histogram(
+            "quizz_http_request_seconds",
+            "Time from ingress to response per route",
+            ("method", "route"),
+        )
+
+        @app.after_request
+        def observe(response: Response) -> Response:
+            route = request.endpoint or "unmatched"
+            seconds = (monotonic_ns() - received_ns()) / 1e9
+            latency.labels(request.method, route).observe(seconds)
+            requests.labels(request.method, route, str(response.status_code)).inc()
+            return response
+
+
+REGISTRY = MetricsRegistry()
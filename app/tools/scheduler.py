@@ -0,0 +1,125 @@
+import logging
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import cache
+from heapq import heappop, heappush
+from itertools import count
+from threading import Condition, Thread
+from time import monotonic
+
+from tools.clock import SimulatedClock
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(eq=False)
+class Timer:
+    when: float
+    callback: Callable[[], None]
+    order: int = 0
+    cancelled: bool = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+    def __lt__(self, other: "Timer") -> bool:
+        return (self.when, self.order) < (other.when, other.order)
+
+
+@dataclass
+class Scheduler:
+    workers: int = 4
+
+    _timers: list[Timer] = field(default_factory=list, init=False)
+    _order: count = field(default_factory=count, init=False)
+    _condition: Condition = field(default_factory=Condition, init=False)
+    _pool: ThreadPoolExecutor | None = field(default=None, init=False)
+    _thread: Thread | None = field(default=None, init=False)
+
+    def call_later(self, delay: float, callback: Callable[[], None]) -> Timer:
+        timer = Timer(
+            when=monotonic() + max(0.0, delay),
+            callback=callback,
+            order=next(self._order),
+        )
+        with self._condition:
+            if self._thread is None:
+                self.__start()
+            heappush(self._timers, timer)
+            if self._timers[0] is timer:
+                self._condition.notify()
+        return timer
+
+    def call_soon(self, callback: Callable[[], None]) -> Timer:
+        return self.call_later(0, callback)
+
+    @property
+    def pending(self) -> int:
+        return len(self._timers)
+
+    def __start(self) -> None:
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="scheduler"
+        )
+        self._thread = Thread(target=self.__run, name="scheduler", daemon=True)
+        self._thread.start()
+
+    def __run(self) -> None:
+        while True:
+            with self._condition:
+                while True:
+                    timeout = (
+                        self._timers[0].when - monotonic() if self._timers else None
+                    )
+                    if timeout is not None and timeout <= 0:
+                        break
+                    self._condition.wait(timeout)
+                timer = heappop(self._timers)
+
+            if timer.cancelled:
+                continue
+            try:
+                self._pool.submit(self.__call, timer.callback)
+            except RuntimeError:
+                return
+
+    @staticmethod
+    def __call(callback: Callable[[], None]) -> None:
+        try:
+            callback()
+        except Exception:
+            logger.exception("Scheduled callback failed")
+
+
+@dataclass
+class SimulatedScheduler(Scheduler):
+    clock: SimulatedClock = field(default_factory=SimulatedClock)
+
+    def call_later(self, delay: float, callback: Callable[[], None]) -> Timer:
+        timer = Timer(
+            when=self.clock.monotonic() + max(0.0, delay),
+            callback=callback,
+            order=next(self._order),
+        )
+        heappush(self._timers, timer)
+        return timer
+
+    def run(self, until: float | None = None) -> int:
+        executed = 0
+        while self._timers and (until is None or self._timers[0].when <= until):
+            timer = heappop(self._timers)
+            if timer.cancelled:
+                continue
+            self.clock.now = max(self.clock.now, timer.when)
+            timer.callback()
+            executed += 1
+
+        if until is not None:
+            self.clock.now = max(self.clock.now, until)
+        return executed
+
+
+@cache
+def default_scheduler() -> Scheduler:
+    return Scheduler()
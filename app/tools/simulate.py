@@ -0,0 +1,116 @@
+import argparse
+import random
+from functools import partial
+from hashlib import sha256
+from time import perf_counter
+
+from model import Answer, Player, Question
+from repository import PlayerRepository, QuizzRepository
+from services import QuestionService
+from tools.clock import SimulatedClock
+from tools.event_stream import EventHub, EventStream
+from tools.scheduler import SimulatedScheduler
+
+OPTIONS = ["a", "b", "c", "d"]
+SCORE_FRAME = "status={{ status }} q={{ current }}"
+
+
+def synthetic_bank(total: int) -> QuizzRepository:
+    bank = QuizzRepository()
+    bank.add_questions(
+        {"statement": f"Question {i}", "answer": "a", "options": OPTIONS.copy()}
+        for i in range(total)
+    )
+    return bank
+
+
+def play(
+    bank: QuizzRepository,
+    rng: random.Random,
+    players: int,
+    questions: int,
+    question_time: int,
+    accuracy: float,
+) -> tuple[list[int], bool]:
+    clock = SimulatedClock(now=1_000_000.0)
+    scheduler = SimulatedScheduler(clock=clock)
+    serv = QuestionService(
+        players=PlayerRepository(),
+        quizz=bank.sample(questions),
+        bank=bank,
+        clock=clock,
+        scheduler=scheduler,
+    )
+    serv.reset(total=questions, qtime=question_time, stime=10, ptime=10)
+
+    roster = [Player(nickname=f"player-{i}") for i in range(players)]
+    for player in roster:
+        serv.players.add_player(player)
+
+    def on_question(question: Question, **kwargs) -> None:
+        for player in roster:
+            right = rng.random() < accuracy
+            option = question.answer if right else rng.choice(question.options)
+            answer = Answer(question_id=question.id, option=option)
+            scheduler.call_later(
+                rng.uniform(0, question_time),
+                partial(serv.evaluate, player.__hash__(), answer),
+            )
+
+    frames = []
+    score = EventStream(
+        event="score", template=SCORE_FRAME, hub=EventHub(), channel="score"
+    )
+
+    def on_score(**kwargs) -> None:
+        frames.append(score.encode(**kwargs)[0])
+
+    serv.add_action(on_question, event="question")
+    serv.add_action(on_score, event="score")
+    serv.start()
+    scheduler.run()
+
+    totals = [serv.players.get_player(player.__hash__()).total for player in roster]
+    return totals, b"data: status=END " in frames[-1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay games on a simulated clock")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--players", type=int, default=30)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--question-time", type=int, default=30)
+    parser.add_argument("--accuracy", type=float, default=0.6)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    rng = random.Random(args.seed)
+    bank = synthetic_bank(max(args.questions * 10, 100))
+    digest = sha256()
+    points = 0
+    ended = 0
+
+    start = perf_counter()
+    for _ in range(args.games):
+        totals, end_frame = play(
+            bank,
+            rng,
+            args.players,
+            args.questions,
+            args.question_time,
+            args.accuracy,
+        )
+        ended += end_frame
+        digest.update(",".join(map(str, totals)).encode())
+        points += sum(totals)
+    elapsed = perf_counter() - start
+
+    print(f"games={args.games} players={args.players} questions={args.questions}")
+    print(f"elapsed={elapsed:.2f}s games_per_minute={args.games / elapsed * 60:.0f}")
+    print(f"points={points} checksum={digest.hexdigest()[:16]}")
+    print(f"end_frames_ok={ended == args.games}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import gzip
+import mimetypes
+import os
+import stat
+from dataclasses import dataclass, field
+from hashlib import blake2b
+from threading import Lock
+
+from flask import Flask, Response, current_app, request
+from werkzeug.security import safe_join
+
+DIGEST_SIZE = 6
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+
+@dataclass(frozen=True)
+class Asset:
+    name: str
+    signature: tuple[int, int]
+    digest: str
+    mimetype: str
+    data: bytes
+    compressed: bytes | None
+
+    @property
+    def fingerprinted(self) -> str:
+        stem, ext = os.path.splitext(self.name)
+        return f"{stem}.{self.digest}{ext}"
+
+
+@dataclass
+class StaticAssets:
+    folder: str
+
+    _assets: dict[str, Asset] = field(default_factory=dict, init=False)
+    _fingerprints: dict[str, Asset] = field(default_factory=dict, init=False)
+    _lock: Lock = field(default_factory=Lock, init=False)
+
+    def asset(self, name: str | None) -> Asset | None:
+        path = safe_join(self.folder, name) if name else None
+        if path is None:
+            return None
+        try:
+            info = os.stat(path)
+        except OSError:
+            info = None
+        if info is None or not stat.S_ISREG(info.st_mode):
+            self.__forget(name)
+            return None
+
+        signature = (info.st_mtime_ns, info.st_size)
+        asset = self._assets.get(name)
+        if asset is not None and asset.signature == signature:
+            return asset
+
+        with open(path, "rb") as f:
+            data = f.read()
+        mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        compressed = None
+        if mimetype.startswith(COMPRESSIBLE):
+            compressed = gzip.compress(data, 9, mtime=0)
+            if len(compressed) >= len(data) * 0.9:
+                compressed = None
+
+        asset = Asset(
+            name=name,
+            signature=signature,
+            digest=blake2b(data, digest_size=DIGEST_SIZE).hexdigest(),
+            mimetype=mimetype,
+            data=data,
+            compressed=compressed,
+        )
+        with self._lock:
+            self.__forget(name)
+            self._assets[name] = asset
+            self._fingerprints[asset.fingerprinted] = asset
+        return asset
+
+    def __forget(self, name: str) -> None:
+        previous = self._assets.pop(name, None)
+        if previous is not None:
+            self._fingerprints.pop(previous.fingerprinted, None)
+
+    def serve(self, filename: str) -> Response:
+        asset = self._fingerprints.get(filename)
+        immutable = asset is not None
+        asset = self.asset(asset.name if immutable else filename)
+        if asset is None or immutable and asset.fingerprinted != filename:
+            return current_app.send_static_file(filename)
+
+        compressed = asset.compressed is not None and "gzip" in request.accept_encodings
+        response = Response(
+            asset.compressed if compressed else asset.data, mimetype=asset.mimetype
+        )
+        response.vary.add("Accept-Encoding")
+        response.cache_control.public = True
+        if immutable:
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        if compressed:
+            response.content_encoding = "gzip"
+            response.set_etag(f"{asset.digest}-gzip")
+        else:
+            response.set_etag(asset.digest)
+        return response.make_conditional(request)
+
+    def init_app(self, app: Flask) -> None:
+        app.extensions["static_assets"] = self
+        app.view_functions["static"] = self.serve
+
+        @app.url_defaults
+        def fingerprint(endpoint: str, values: dict) -> None:
+            if endpoint == "static":
+                asset = self.asset(values.get("filename"))
+                if asset is not None:
+                    values["filename"] = asset.fingerprinted
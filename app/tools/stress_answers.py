@@ -0,0 +1,67 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from random import choice
+from time import perf_counter
+
+from model import Player, Question
+from repository import PlayerRepository
+from services import AnswerIngestor
+
+OPTIONS = ["a", "b", "c", "d"]
+
+
+def run(players: int, threads: int, repeat: int) -> dict:
+    roster = PlayerRepository()
+    for id in range(players):
+        roster.add_player(Player(nickname=f"player-{id}"))
+    ingestor = AnswerIngestor(award=roster.add_point)
+    question = Question(statement="stress", answer="a", options=OPTIONS.copy())
+    votes = [choice(OPTIONS) for _ in range(players)]
+
+    def submit(id: int) -> bool:
+        return ingestor.submit(id, question, votes[id], 1)
+
+    ids = [id for id in range(players) for _ in range(repeat)]
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        accepted = sum(pool.map(submit, ids, chunksize=64))
+    elapsed = perf_counter() - start
+
+    expected = {option: 0 for option in OPTIONS}
+    for option in votes:
+        expected[option] += 1
+
+    return {
+        "submitted": len(ids),
+        "accepted": accepted,
+        "counts_ok": question.answers == expected,
+        "points_ok": sum(points for _, points in roster.scores()) == expected["a"],
+        "leaderboard_ok": [p.total for p in roster.top(players)]
+        == [1] * expected["a"] + [0] * (players - expected["a"]),
+        "seconds": elapsed,
+        "answers_per_second": len(ids) / elapsed,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Concurrent /answer ingestion stress")
+    parser.add_argument("--players", type=int, default=20_000)
+    parser.add_argument("--threads", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    result = run(args.players, args.threads, args.repeat)
+    for name, value in result.items():
+        print(f"{name:>20}: {value}")
+
+    if not (
+        result["counts_ok"]
+        and result["points_ok"]
+        and result["leaderboard_ok"]
+        and result["accepted"] == args.players
+    ):
+        raise SystemExit("answer totals do not match the submitted answers")
+
+
+if __name__ == "__main__":
+    main()
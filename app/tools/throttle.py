@@ -0,0 +1,48 @@
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from threading import Lock
+
+from tools.clock import Clock
+from tools.scheduler import Scheduler, Timer, default_scheduler
+
+
+@dataclass
+class ThrottledPublisher:
+    publish: Callable[[], None]
+    interval: float = 0.25
+    scheduler: Scheduler = field(default_factory=default_scheduler)
+    clock: Clock = field(default_factory=Clock)
+
+    _dirty: bool = field(default=False, init=False)
+    _last: float = field(default=0.0, init=False)
+    _timer: Timer | None = field(default=None, init=False)
+    _lock: Lock = field(default_factory=Lock, init=False)
+    _publish_lock: Lock = field(default_factory=Lock, init=False)
+
+    def mark(self) -> None:
+        with self._lock:
+            self._dirty = True
+            if self._timer is None:
+                delay = self._last + self.interval - self.clock.monotonic()
+                self._timer = self.scheduler.call_later(delay, self.__fire)
+
+    def flush(self) -> None:
+        with self._publish_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                self._dirty = False
+                self._last = self.clock.monotonic()
+            self.publish()
+
+    def discard(self) -> None:
+        with self._lock:
+            self._dirty = False
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def __fire(self) -> None:
+        with self._lock:
+            self._timer = None
+        self.flush()
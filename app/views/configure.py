@@ -1,10 +1,19 @@
+from functools import partial
+from http import HTTPStatus
+from io import BytesIO
+
+from analytics import ResultStore
 from flask import (
     Blueprint,
+    abort,
     current_app,
     render_template,
     request,
+    send_file,
+    url_for,
 )
-from services import QuestionService
+from rooms import Room, RoomRegistry, current_room
+from tools.metrics import CONTENT_TYPE, MetricsRegistry
 
 router_configure = Blueprint("admin", __name__, url_prefix="/admin")
 COFIG_TEMPLATE = "config.html"
@@ -12,54 +21,164 @@ COFIG_TEMPLATE = "config.html"
 
 @router_configure.get("/")
 def config_index():
-    serv: QuestionService = current_app.extensions["question_service"]
+    room = current_room()
+    serv = room.service
 
     return render_template(
         COFIG_TEMPLATE,
-        status=serv.status,
-        waiting=serv.remain_time,
+        status=room.status,
+        waiting=room.remain_time,
         question_time=serv.QUESTION_TIME,
         score_time=serv.SCORE_TIME,
         players_time=serv.PLAYERS_TIME,
         total_questions=serv.TOTAL_QUESTIONS,
+        filters=serv.FILTERS,
+        quotas=serv.QUOTAS,
         is_show=False,
     )
 
 
+@router_configure.get("/subscribers")
+def subscribers():
+    hub = current_room().hub
+
+    return {
+        "active": hub.active,
+        "channels": {
+            channel: hub.count(channel)
+            for channel in ("question", "graphic", "score", "end")
+        },
+        "messages": hub.metrics,
+    }
+
+
+@router_configure.get("/metrics")
+def metrics():
+    registry: MetricsRegistry = current_app.extensions["metrics"]
+
+    return current_app.response_class(registry.render(), content_type=CONTENT_TYPE)
+
+
+@router_configure.get("/analytics")
+def analytics():
+    results: ResultStore = current_app.extensions["results"]
+
+    return results.summary(request.args.get("top", 20, type=int))
+
+
+@router_configure.get("/analytics/export")
+def analytics_export():
+    results: ResultStore = current_app.extensions["results"]
+    buffer = BytesIO()
+    results.export(buffer)
+    buffer.seek(0)
+
+    return send_file(
+        buffer,
+        mimetype="application/octet-stream",
+        as_attachment=True,
+        download_name="results.fpqr",
+    )
+
+
+@router_configure.record_once
+def register_results(state):
+    rooms: RoomRegistry = state.app.extensions["rooms"]
+    results = state.app.extensions.setdefault("results", ResultStore())
+    rooms.on_create(partial(collect_results, results))
+
+
+def collect_results(results: ResultStore, room: Room) -> None:
+    room.service.add_action(partial(record_game, results, room), event="end")
+
+
+def record_game(results: ResultStore, room: Room, **kwargs) -> None:
+    question_ids, columns = room.service.answers.results()
+    results.add_game(
+        room.code,
+        room.service.questions(),
+        room.players.roster(),
+        question_ids,
+        columns,
+    )
+
+
+def room_info(room: Room) -> dict:
+    return {
+        "code": room.code,
+        "url": url_for("app.join", code=room.code, _external=True),
+        "status": room.status.name,
+        "players": room.players.total,
+        "subscribers": room.hub.active,
+    }
+
+
+@router_configure.get("/rooms")
+def rooms():
+    registry: RoomRegistry = current_app.extensions["rooms"]
+    registry.collect()
+
+    return {"rooms": [room_info(room) for room in registry]}
+
+
+@router_configure.post("/rooms")
+def create_room():
+    registry: RoomRegistry = current_app.extensions["rooms"]
+
+    return room_info(registry.create()), HTTPStatus.CREATED
+
+
 @router_configure.get("/config")
 def config():
-    serv: QuestionService = current_app.extensions["question_service"]
+    room = current_room()
+    serv = room.service
 
     return render_template(
         COFIG_TEMPLATE,
-        status=serv.status,
-        waiting=serv.remain_time,
+        status=room.status,
+        waiting=room.remain_time,
         question_time=serv.QUESTION_TIME,
         score_time=serv.SCORE_TIME,
         players_time=serv.PLAYERS_TIME,
         total_questions=serv.TOTAL_QUESTIONS,
+        filters=serv.FILTERS,
+        quotas=serv.QUOTAS,
         is_show=True,
     )
 
 
 @router_configure.post("/config")
 def config_post():
-    serv: QuestionService = current_app.extensions["question_service"]
+    room = current_room()
+    serv = room.service
 
     total = int(request.form.get("total", 10))
     qtime = int(request.form.get("qtime", 30))
     stime = int(request.form.get("stime", 20))
     ptime = int(request.form.get("ptime", 10))
-
-    serv.reset(total=total, qtime=qtime, stime=stime, ptime=ptime)
+    filters = request.form.get("filters", "").strip()
+    quotas = request.form.get("quotas", "").strip()
+    try:
+        room.configure(
+            total=total,
+            qtime=qtime,
+            stime=stime,
+            ptime=ptime,
+            filters=filters,
+            quotas=quotas,
+        )
+    except ValueError as error:
+        abort(HTTPStatus.BAD_REQUEST, str(error))
 
     return render_template(
         COFIG_TEMPLATE,
-        status=serv.status,
-        waiting=serv.remain_time,
+        status=room.status,
+        waiting=room.remain_time,
         question_time=serv.QUESTION_TIME,
         score_time=serv.SCORE_TIME,
         players_time=serv.PLAYERS_TIME,
         total_questions=serv.TOTAL_QUESTIONS,
+        filters=serv.FILTERS,
+        quotas=serv.QUOTAS,
         is_show=False,
     )
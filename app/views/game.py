@@ -1,9 +1,13 @@
+from functools import partial
 from http import HTTPStatus
 from random import choice
+from uuid import uuid4
 
 from flask import (
     Blueprint,
+    Flask,
     Response,
+    abort,
     current_app,
     make_response,
     redirect,
@@ -13,11 +17,12 @@ from flask import (
     session,
     url_for,
 )
-from model import Answer, Avatar, Player
-from repository import PlayerRepository
-from services import QuestionService
-from tools.avatars import load_avatars
-from tools.event_stream import EventStream, EventStreamTemplate
+from model import Answer, Avatar, Player, Question
+from rooms import Room, RoomRegistry, current_room
+from tools.admission import admitted
+from tools.avatars import avatar_gallery, load_avatars
+from tools.event_stream import EventHub, EventStream, EventStreamTemplate, Subscriber
+from tools.ingress import received_ns
 
 router = Blueprint("app", __name__)
 
@@ -38,10 +43,26 @@ def index():
     )
 
 
+@router.get("/r/<code>")
+def join(code: str):
+    rooms: RoomRegistry = current_app.extensions["rooms"]
+    room = rooms.get(code.upper())
+    if room is None:
+        abort(HTTPStatus.NOT_FOUND)
+
+    if session.get("room") != room.code:
+        session["room"] = room.code
+        session["player"] = None
+    return redirect(url_for(INDEX_FUNC), HTTPStatus.SEE_OTHER)
+
+
 @router.get("/avatars")
 def avatars():
-    avatars = load_avatars(current_app.static_folder)
-    return render_template("components/avatar_galery.html", avatars=avatars)
+    version, gallery = avatar_gallery(current_app.static_folder)
+    response = make_response(gallery)
+    response.set_etag(str(version))
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 
 @router.get("/logout")
@@ -50,17 +71,35 @@ def logout():
     return redirect(url_for(INDEX_FUNC), HTTPStatus.SEE_OTHER)
 
 
+def register_player(player: Player) -> Room | None:
+    room = current_room()
+    room.start()
+    if not room.register(player):
+        return None
+
+    session["room"] = room.code
+    session["player"] = player.__hash__()
+    return room
+
+
 @router.post("/register")
+@admitted
 def register():
+    if register_player(Player(**dict(request.form))) is None:
+        return redirect(url_for(INDEX_FUNC), HTTPStatus.SEE_OTHER)
+
+    return redirect(url_for("app.quizz"), HTTPStatus.SEE_OTHER)
+
+
+@router.post("/join")
+@admitted
+def join_game():
     player = Player(**dict(request.form))
-    repo: PlayerRepository = current_app.extensions["repo"]
-    serv: QuestionService = current_app.extensions["question_service"]
-    serv.start()
-    if repo.add_player(player) and serv.waiting_player():
-        session["player"] = player.__hash__()
-        return redirect(url_for("app.quizz"), HTTPStatus.SEE_OTHER)
+    room = register_player(player)
+    if room is None:
+        return redirect(url_for(INDEX_FUNC), HTTPStatus.SEE_OTHER)
 
-    return redirect(url_for(INDEX_FUNC), HTTPStatus.SEE_OTHER)
+    return render_template("join.html", player=player, waiting=room.remain_time)
 
 
 @router.get("/quizz")
@@ -68,13 +107,11 @@ def quizz():
     if session.get("player") is None:
         return redirect(url_for(INDEX_FUNC), HTTPStatus.SEE_OTHER)
 
-    repo: PlayerRepository = current_app.extensions["repo"]
-    serv: QuestionService = current_app.extensions["question_service"]
-
-    player = repo.get_player(session.get("player"))
+    room = current_room()
+    player = room.get_player(session.get("player"))
 
     response = make_response(
-        render_template("quizz.html", player=player, waiting=serv.remain_time)
+        render_template("quizz.html", player=player, waiting=room.remain_time)
     )
     response.headers["HX-Trigger"] = "player-info"
 
@@ -86,8 +123,7 @@ def player_info():
     if session.get("player") is None:
         return render_template_string("")
 
-    repo: PlayerRepository = current_app.extensions["repo"]
-    player = repo.get_player(session.get("player"))
+    player = current_room().get_player(session.get("player"))
 
     return render_template("components/player_info.html", player=player)
 
@@ -99,8 +135,9 @@ def answer():
 
     answer = Answer(**dict(request.form))
 
-    serv: QuestionService = current_app.extensions["question_service"]
-    question = serv.evaluate(session.get("player"), answer=answer)
+    question = current_room().evaluate(
+        session.get("player"), answer=answer, received_ns=received_ns()
+    )
 
     return render_template(
         "components/answer.html",
@@ -109,46 +146,93 @@ def answer():
     )
 
 
-@router.get("/events")
-def events():
-    player = False if session.get("player") is None else True
-    serv: QuestionService = current_app.extensions["question_service"]
-    app = current_app._get_current_object()
+OPTION_VARIANTS = 6
+RANK_TEMPLATE = "<div>🏅 {{ rank }} / {{ total }}</div>"
+PLAYER_CHANNELS = ("question", "end", "graphic", "score")
+VIEWER_CHANNELS = ("score",)
+
 
-    if player:
-        event_question = EventStreamTemplate(
+def question_variants(question: Question, **kwargs) -> list[dict]:
+    return [
+        {**kwargs, "question": question, "options": options}
+        for options in question.permutations(OPTION_VARIANTS)
+    ]
+
+
+def bind_streams(app: Flask, room: Room) -> None:
+    serv = room.service
+    hub = room.hub
+
+    event_rank = EventStream(
+        event="rank", template=RANK_TEMPLATE, hub=hub, channel="rank"
+    )
+
+    def player_rank(subscriber: Subscriber) -> bytes | None:
+        if subscriber.player is None:
+            return None
+        rank = room.rank_of(subscriber.player)
+        if rank is None:
+            return None
+        return event_rank.message(rank=rank[0], total=rank[1])
+
+    streams = (
+        EventStreamTemplate(
             event="question",
             template="components/question.html",
+            hub=hub,
+            channel="question",
+            app=app,
+            variants=question_variants,
+        ),
+        EventStream(event="end-game", template="", hub=hub, channel="end"),
+        EventStreamTemplate(
+            event="question",
+            template="components/score.html",
+            hub=hub,
+            channel="score",
+            app=app,
+            personal=player_rank,
+        ),
+        EventStreamTemplate(
+            event="answer-graphic",
+            template="components/answer_graphic.html",
+            hub=hub,
+            channel="graphic",
             app=app,
-        )
-        serv.add_action(event_question.action_stream, event="question")
+        ),
+    )
+    for stream in streams:
+        serv.add_action(stream.action_stream, event=stream.channel)
 
-        event_ended = EventStream(event="end-game", template="")
-        serv.add_action(event_ended.action_stream, event="end")
 
-    event_score = EventStreamTemplate(
-        event="question",
-        template="components/score.html",
-        app=app,
-    )
-    serv.add_action(event_score.action_stream, event="score")
+@router.record_once
+def register_streams(state):
+    rooms: RoomRegistry = state.app.extensions["rooms"]
+    rooms.on_create(partial(bind_streams, state.app))
 
-    event_graphic = EventStreamTemplate(
-        event="answer-graphic",
-        template="components/answer_graphic.html",
-        app=app,
-    )
-    serv.add_action(event_graphic.action_stream, event="graphic")
 
-    def event_stream(player: bool = True):
-        while True:
-            if player:
-                yield from event_question.stream()
-                yield from event_ended.stream()
-                yield from event_graphic.stream()
-            yield from event_score.stream()
+def event_subscription() -> tuple[
+    EventHub, tuple[str, ...], str, int | None, int | None
+]:
+    player = session.get("player")
+    if session.get("sid") is None:
+        session["sid"] = uuid4().hex
+
+    channels = VIEWER_CHANNELS if player is None else PLAYER_CHANNELS
+    key = f"{session['sid']}:{'viewer' if player is None else 'player'}"
+    last_event_id = request.headers.get("Last-Event-ID", "")
+    last_event_id = int(last_event_id) if last_event_id.isdigit() else None
+    return current_room().hub, channels, key, player, last_event_id
+
 
-    return Response(event_stream(player=player), mimetype="text/event-stream")
+@router.get("/events")
+def events():
+    hub, channels, key, player, last_event_id = event_subscription()
+
+    return Response(
+        hub.listen(*channels, key=key, player=player, last_event_id=last_event_id),
+        mimetype="text/event-stream",
+    )
 
 
 @router.get("/score")